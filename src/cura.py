@@ -25,7 +25,10 @@ def main():
     subparsers.add_parser("resetlog", help="Reset log file")
     subparsers.add_parser("cbinspection", help="Run codebook inspection")
     subparsers.add_parser("ddinspection", help="Run domain inspection")
-    subparsers.add_parser("run", help="Run full processing")
+    run_parser = subparsers.add_parser("run", help="Run full processing")
+    run_parser.add_argument(
+        "--resume", action="store_true", help="Resume an interrupted domain data export"
+    )
 
     # Parse arguments
     args = parser.parse_args()
@@ -53,7 +56,7 @@ def main():
             case "ddinspection":
                 ddinspection(project_manager)
             case "run":
-                run(project_manager)
+                run(project_manager, resume=args.resume)
             case "reset":
                 reset(project_manager)
             case "resetlog":
@@ -147,7 +150,7 @@ def resetlog(project_manager):
         project_manager.logger.warning(" -> LOG FILE NOT RESET")
 
 
-def run(project_manager):
+def run(project_manager, resume=False):
     #  ----- INITIALIZING -----
     target_data_structures = input("\n> What target(s) to inspect? (cb/dd/both): ")
     
@@ -179,6 +182,8 @@ def run(project_manager):
             case "both":
                 codebook_processor.run_codebook_pre_processing()
                 domain_processor.run_domain_pre_processing()
+                # Domain inspections (eg. codebook_conformance) follow the codebook edits
+                domain_processor.attach_codebook(codebook_processor.parsed_codebook)
 
     def target_inspection(target_data_structures, skip_inspection):
         match target_data_structures.lower():
@@ -358,7 +363,7 @@ def run(project_manager):
 
     if target_data_structures.lower() in ["dd", "both"]:
         if (input("\n> Would you like to export the domain data? (y/n): ").lower() == "y"):
-            domain_processor.run_export()
+            domain_processor.run_export(resume=resume)
             project_manager.logger.info(" -> DOMAIN DATA EXPORTED")
         else:
             project_manager.logger.info(" -> NO DOMAIN DATA EXPORTED")
@@ -13,6 +13,10 @@ from pyiceberg.types import StringType
 
 #from domain_data_parsers.base_parse_domain import BaseDomainDataParser
 from src.parsers.base_parsing_manager import BaseParsingManager
+from src.shared.utils import prefetch
+
+# Input files that are read ahead while the current one is appended to the table
+PARSE_PREFETCH_FILES = 1
 
 
 class DomainParsingManager(BaseParsingManager):
@@ -38,6 +42,7 @@ class DomainParsingManager(BaseParsingManager):
         self.ingestion_tracker_path = filtered_dd_mirror / "ingestion_tracker.json"
         self.catalog_db_path = filtered_dd_mirror / "pyiceberg_catalog.db"
         self.add_id = parsing_options["add_id"]
+        self.table = None
         self.source_csv_structure_analysis_path = filtered_dd_mirror / "structure_analysis.json"
         self.default_args = {
             "csv": {
@@ -155,6 +160,7 @@ class DomainParsingManager(BaseParsingManager):
             if skip.lower() != "y":
                 self.logger.info("Skipping checksum check.")
 
+                self.table = table
                 parsed_table = pl.scan_iceberg(table)
                 
                 return parsed_table
@@ -165,71 +171,110 @@ class DomainParsingManager(BaseParsingManager):
             raise ValueError("Input CSV structure is invalid. See structure_analysis.json for details.")
         
         total_files = len(list(self.input_paths.iterdir()))
-        current_id = 1
-
-        for file_path in self.input_paths.iterdir():
-            if file_path.is_file():
-
-                checksum, parse = _lookup_file(file_path, ingestion_tracker)
-
-                if parse: # ----------- DEBUG ! -----------
-                    
-                    #CONFIG SPEC ! SEPARATOR IS ;
-
-                    separator = self.structure_analysis["file_separators"][file_path.name]
-                    
-                    lf =  pl.scan_csv(file_path, infer_schema_length=0, separator=separator)
-                    #lf =  pl.scan_csv(file_path, infer_schema_length=0, separator=",") # get the namespace error
-                    
-                    # check if all whitelist columns are present in lf
-                    #print(lf.collect_schema().names())
-                    
-                    missing_cols = [c for c in self.white_list if c not in lf.collect_schema().names()]
-                    if missing_cols:
-                        raise ValueError(f"File {file_path.name} is missing columns: {missing_cols}")
-
-                    cols = self.white_list
-                    lf = lf.select(cols)
-
-                    # HERE WE ADD FILE_NAME COLUMN !
-                    lf = lf.with_columns(pl.lit(file_path.name).alias("file_name"))
-
-                    # HERE WE ADD ID COLUMN !
-                    # ID might need to reset per file
-                    if self.add_id:
-                        # Collect row count efficiently
-                        n_rows = lf.select(pl.count()).collect().item()
-                        # Add a unique, incrementing id per row, id is string
-                        lf = lf.with_columns(pl.arange(current_id, current_id + n_rows).alias("pyCura_id").cast(pl.Utf8))
-                        # make sure it is a string
-
-                        current_id += n_rows
-
-                    ## This will not add to the global whitelist
-                    #self.white_list.insert(0, "id")
-
-                    # HERE WE APPEND TO TABLE !
-                    table.append(lf.collect(engine='streaming').to_arrow())
-                    
-                    
-                    #for snapshot in table.metadata.snapshots:
-                     #   print(str(snapshot))
-
-                    ingestion_tracker[file_path.name] = {
-                        "checksum": checksum,
-                        "snapshot": str(table.metadata.snapshots[-1])
-                    }
-
-                    with open(self.ingestion_tracker_path, "w") as f:
-                        json.dump(ingestion_tracker, f, indent=4)
-                    
-                    total_files -= 1
-                    self.logger.info(f"Parsed {file_path.name} - {total_files} files remaining")
 
+        def _read_new_files():
+            """Read the files to parse into Arrow tables, one at a time and in order
+            (the ids continue from file to file)."""
+            current_id = 1
+            for file_path in self.input_paths.iterdir():
+                if file_path.is_file():
+
+                    checksum, parse = _lookup_file(file_path, ingestion_tracker)
+
+                    if parse: # ----------- DEBUG ! -----------
+                        
+                        #CONFIG SPEC ! SEPARATOR IS ;
+
+                        separator = self.structure_analysis["file_separators"][file_path.name]
+                        
+                        lf =  pl.scan_csv(file_path, infer_schema_length=0, separator=separator)
+                        #lf =  pl.scan_csv(file_path, infer_schema_length=0, separator=",") # get the namespace error
+                        
+                        # check if all whitelist columns are present in lf
+                        #print(lf.collect_schema().names())
+                        
+                        missing_cols = [c for c in self.white_list if c not in lf.collect_schema().names()]
+                        if missing_cols:
+                            raise ValueError(f"File {file_path.name} is missing columns: {missing_cols}")
+
+                        cols = self.white_list
+                        lf = lf.select(cols)
+
+                        # HERE WE ADD FILE_NAME COLUMN !
+                        lf = lf.with_columns(pl.lit(file_path.name).alias("file_name"))
+
+                        # HERE WE ADD ID COLUMN !
+                        # ID might need to reset per file
+                        if self.add_id:
+                            # Collect row count efficiently
+                            n_rows = lf.select(pl.count()).collect().item()
+                            # Add a unique, incrementing id per row, id is string
+                            lf = lf.with_columns(pl.arange(current_id, current_id + n_rows).alias("pyCura_id").cast(pl.Utf8))
+                            # make sure it is a string
+
+                            current_id += n_rows
+
+                        ## This will not add to the global whitelist
+                        #self.white_list.insert(0, "id")
+
+                        yield file_path, checksum, lf.collect(engine='streaming').to_arrow()
+
+        # The next file is read while the current one is appended to the table
+        for file_path, checksum, arrow_table in prefetch(_read_new_files(), PARSE_PREFETCH_FILES):
+
+            # HERE WE APPEND TO TABLE !
+            table.append(arrow_table)
+            
+            
+            #for snapshot in table.metadata.snapshots:
+             #   print(str(snapshot))
+
+            ingestion_tracker[file_path.name] = {
+                "checksum": checksum,
+                "snapshot": str(table.metadata.snapshots[-1]),
+                "snapshot_id": table.metadata.snapshots[-1].snapshot_id,
+            }
+
+            with open(self.ingestion_tracker_path, "w") as f:
+                json.dump(ingestion_tracker, f, indent=4)
+            
+            total_files -= 1
+            self.logger.info(f"Parsed {file_path.name} - {total_files} files remaining")
+
+        self.table = table
         parsed_table = pl.scan_iceberg(table)
 
         return parsed_table
 
+    def scan_data_files(self) -> pl.LazyFrame:
+        """Scan the parquet data files of the parsed iceberg table directly.
+
+        The table is only ever appended to (no deletes, no schema evolution), so its
+        data files hold exactly the rows of pl.scan_iceberg(table). Unlike the iceberg
+        scan, this source can be run with the streaming engine (polars 1.26).
+        """
+        return pl.scan_parquet(self.data_files())
+
+    def data_files(self) -> list[str]:
+        """Paths of the live parquet data files of the parsed table, in the order
+        they were appended (= ingestion order)."""
+        if self.table is None:
+            raise ValueError("No parsed table available - run parse_all() first")
+
+        snapshot = self.table.current_snapshot()
+        if snapshot is None:
+            raise ValueError("The parsed table has no data files")
+
+        entries = [
+            entry
+            for manifest in snapshot.manifests(self.table.io)
+            for entry in manifest.fetch_manifest_entry(self.table.io, discard_deleted=True)
+        ]
+        return [
+            entry.data_file.file_path.removeprefix("file://")
+            for entry in sorted(entries, key=lambda entry: entry.sequence_number)
+        ]
+
 
     def _inspect_csv_structure(self) -> bool:
         """
@@ -1,5 +1,10 @@
 import polars as pl
 
+# Derives a new column from another one - not a function of the edited cell value
+ELEMENTWISE = False
+# ... but of the row alone, so the export can apply it batch by batch
+ROWWISE = True
+
 def append_column(data: tuple[pl.LazyFrame, str], source_column: str, regex_pattern: str):
     """
     Append a new field to the LazyFrame by extracting values from a source column.
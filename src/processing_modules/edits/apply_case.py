@@ -1,5 +1,6 @@
 import polars as pl
 
+ELEMENTWISE = True
 
 def apply_case(data: list[tuple[str,any]] | dict[str, any] | tuple [pl.LazyFrame, str], case: str, target_values = False) -> list[tuple[str,any]] | dict[str, any]:
     def apply_case_cell(cell: str, case: str) -> str:
@@ -1,5 +1,7 @@
 import polars as pl
 
+ELEMENTWISE = True
+
 def apply_char_replace(data: list[tuple[str,any]] | dict[str, any] | tuple[pl.LazyFrame, str], char_replace: list[list[str, str]], target_values = False) -> list[tuple[str,any]] | dict[str, any]:
     def apply_char_replace_cell(cell: str, char_replace: list[list[str, str]]) -> str:
         
@@ -1,5 +1,6 @@
 import polars as pl
 
+ELEMENTWISE = True
 
 def apply_padding(
     data: list[tuple[str, int]] | dict[str, any] | tuple[pl.LazyFrame, str],
@@ -1,6 +1,8 @@
 import polars as pl
 import re
 
+ELEMENTWISE = True
+
 def apply_token_replace(data: list[tuple[str,any]] | dict[str, any] | tuple[pl.LazyFrame, str], tok_replace: list[list[str, str]], target_values = False) -> list[tuple[str,any]] | dict[str, any]:
     def apply_token_replace_cell(cell: str, tok_replace: list[list[str, str]]) -> str:
         # Check if the cell exactly matches any token to be replaced
@@ -2,8 +2,13 @@
 
 import polars as pl
 
-def char_map(data: list | dict[str, any] | tuple[pl.LazyFrame, list[str]], target_values: bool) -> dict[str, any]:
-    """get all the unique characters in the data for each key, and return a dict with the key as the key and the unique characters as the value, sorted alphabetically"""
+SUPPORTS_VALUE_COUNTS = True  # only the distinct values matter
+
+def char_map(data: list | dict[str, any] | tuple[pl.LazyFrame, list[str]], target_values: bool, by_file: bool = False) -> dict[str, any]:
+    """get all the unique characters in the data for each key, and return a dict with the key as the key and the unique characters as the value, sorted alphabetically
+
+    For a LazyFrame, by_file=True also groups by 'file_name' in the same query and
+    returns {"all_files": [...], "by_file": {file_name: [...]}} per column."""
 
     if isinstance(data, list):
         unique_chars = set()
@@ -42,8 +47,9 @@ def char_map(data: list | dict[str, any] | tuple[pl.LazyFrame, list[str]], targe
 
         return list_chars_per_key
     
-    elif isinstance(data, tuple) and len(data) == 2 and isinstance(data[0], pl.LazyFrame):
-        lf, white_list = data
+    elif isinstance(data, tuple) and len(data) in (2, 3) and isinstance(data[0], pl.LazyFrame):
+        # A third element (weight column) does not matter for unique characters
+        lf, white_list = data[0], data[1]
         char_map_dict = {}
         lf_schema = lf.collect_schema().names()
         total_cols = len(white_list)
@@ -68,6 +74,31 @@ def char_map(data: list | dict[str, any] | tuple[pl.LazyFrame, list[str]], targe
             #unique_chars = sorted(set(all_chars))
         
             
+            if by_file:
+                # One grouped query: unique (file_name, char) pairs
+                file_chars_df = (
+                    lf
+                    .select(pl.col("file_name"), pl.col(col).str.split("").alias("unique_chars"))
+                    .explode("unique_chars")
+                    .unique()
+                    .sort("file_name", "unique_chars")
+                    .collect()
+                )
+                by_file_map = {
+                    file_name: file_df["unique_chars"].to_list()
+                    for (file_name,), file_df in file_chars_df.partition_by(
+                        "file_name", as_dict=True, maintain_order=True
+                    ).items()
+                }
+                char_map_dict[col] = {
+                    "all_files": file_chars_df["unique_chars"].unique().sort().to_list(),
+                    "by_file": by_file_map,
+                }
+                total_cols -= 1
+                print(f"\n char_map (by_file) for {col} {time.time() - start:.2f}s. {total_cols} left")
+                print(char_map_dict[col]["all_files"])
+                continue
+
             char_lf = (
                 lf
                 .select(
@@ -0,0 +1,88 @@
+import polars as pl
+
+SUPPORTS_VALUE_COUNTS = True
+REQUIRES_CODEBOOK = True
+
+def codebook_conformance(data: tuple[pl.LazyFrame, list[str]], target_values: bool, codebook: dict[str, any] | None = None) -> dict[str, any]:
+    """
+    Check the domain values of each column against the codebook keys of that column.
+
+    Per column, the distinct domain values (with counts) are joined against the
+    codes in codebook["data"][column] - one vectorized full join per column.
+    Values without a code are reported with their counts, codes that never occur
+    in the data are reported as unused.
+
+    Args:
+        data: (lf, white_list) or (lf, white_list, weight), where weight names a
+            column holding how many rows each row stands for (value-count table)
+        target_values: Not used in this inspection
+        codebook: The parsed codebook ({"data": ..., "metadata": ...})
+
+    Returns:
+        {
+            "ED": {
+                "matched_values": 10,     # distinct values found in the codebook
+                "matched_count": 251000,  # rows with such a value
+                "unmatched_values": 1,
+                "unmatched_count": 1000,
+                "unmatched": {" ": 1000},
+                "unused_codes": ["99"]
+            }
+        }
+        Columns that are not part of the codebook are reported as {"in_codebook": False}.
+    """
+    if not isinstance(data, tuple):
+        raise ValueError("codebook_conformance is only supported for domain data")
+    if codebook is None:
+        raise ValueError("codebook_conformance requires the parsed codebook")
+
+    lf, white_list = data[0], data[1]
+    weight = data[2] if len(data) > 2 else None
+    count_expr = pl.col(weight).sum() if weight else pl.len()
+
+    conformance = {}
+    lf_schema = lf.collect_schema().names()
+    total_cols = len(white_list)
+    for col in white_list:
+        if col not in lf_schema:
+            continue
+        import time
+        start = time.time()
+
+        if col not in codebook["data"]:
+            conformance[col] = {"in_codebook": False}
+            total_cols -= 1
+            continue
+
+        codes_lf = pl.LazyFrame(
+            {col: list(codebook["data"][col].keys())}, schema={col: pl.Utf8}
+        ).with_columns(pl.lit(True).alias("in_codebook"))
+
+        # Distinct values with counts, fully joined against the codes:
+        # - no code      -> in_codebook is null
+        # - never occurs -> count is null
+        joined_df = (
+            lf
+            .group_by(col)
+            .agg(count_expr.alias("count"))
+            .join(codes_lf, on=col, how="full", coalesce=True)
+            .collect()
+        )
+
+        matched_df = joined_df.filter(pl.col("in_codebook").is_not_null() & pl.col("count").is_not_null())
+        unmatched_df = joined_df.filter(pl.col("in_codebook").is_null()).sort("count", descending=True)
+        unused_df = joined_df.filter(pl.col("count").is_null()).sort(col)
+
+        conformance[col] = {
+            "matched_values": matched_df.height,
+            "matched_count": int(matched_df["count"].sum()),
+            "unmatched_values": unmatched_df.height,
+            "unmatched_count": int(unmatched_df["count"].sum()),
+            "unmatched": dict(zip(unmatched_df[col].to_list(), unmatched_df["count"].to_list())),
+            "unused_codes": unused_df[col].to_list(),
+        }
+        total_cols -= 1
+        print(f"\n codebook_conformance for {col} {time.time() - start:.2f}s. {total_cols} left")
+        print({k: v for k, v in conformance[col].items() if k != "unmatched"})
+
+    return conformance
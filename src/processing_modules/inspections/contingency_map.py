@@ -0,0 +1,112 @@
+import polars as pl
+
+BOUNDED_OUTPUT = True  # max_cells plus the overflow bucket
+
+
+def _escape(expr: pl.Expr) -> pl.Expr:
+    """Escape the cell separator (and the escape character) in a value."""
+    return expr.cast(pl.String).str.replace_all("\\", "\\\\", literal=True).str.replace_all("|", "\\|", literal=True)
+
+
+def contingency_map(data: tuple[pl.LazyFrame, list[str]], target_values: bool, columns: list[list[str]] | None = None, max_cells: int = 1000) -> dict[str, any]:
+    """
+    Cross-tabulate (joint counts of) configured column pairs or tuples.
+
+    Each tuple is counted with a multi-column group_by. All tuples are collected
+    together, so the scan of the table is shared. Only the max_cells most frequent cells are
+    kept; the remaining cells go to an overflow bucket, so high-cardinality
+    combinations cannot blow up the JSON.
+
+    Config example:
+        "contingency_map": {"active": true, "columns": [["AG", "ED"], ["AG", "ED", "HE"]], "max_cells": 500}
+
+    Args:
+        data: (lf, white_list)
+        target_values: Not used in this inspection
+        columns: List of column pairs/tuples to cross-tabulate
+        max_cells: Maximum number of cells to keep per tuple
+
+    Returns:
+        Results are stored under the first column of each tuple, cells are keyed
+        by the values joined with '|' (nulls as '<null>'). A '|' or '\\' in a value
+        is escaped with a backslash, so "a|b" x "c" is "a\\|b|c" and "a" x "b|c"
+        is "a|b\\|c":
+        {
+            "AG": {
+                "AG x ED": {
+                    "cells": {"3|01": 27000, ...},
+                    "total_cells": 55,
+                    "total_count": 332000,
+                    "overflow": {"cells": 0, "count": 0}
+                }
+            },
+            "ED": {}
+        }
+    """
+    if not isinstance(data, tuple):
+        raise ValueError("contingency_map is only supported for domain data")
+    if not columns:
+        raise ValueError("contingency_map requires 'columns', eg. [[\"AG\", \"ED\"]]")
+
+    lf, white_list = data[0], data[1]
+    lf_schema = lf.collect_schema().names()
+    max_cells = int(max_cells)
+
+    contingency_dict = {col: {} for col in white_list}
+
+    queries = []
+    tuples = []
+    for column_tuple in columns:
+        if len(column_tuple) < 2:
+            raise ValueError(f"contingency_map needs at least two columns per tuple, got {column_tuple}")
+        missing = [col for col in column_tuple if col not in lf_schema]
+        if missing:
+            print(f"\n contingency_map: skipping {column_tuple}, missing columns {missing}")
+            continue
+
+        cells_lf = (
+            lf
+            .group_by(column_tuple)
+            .agg(pl.len().alias("count"))
+        )
+        top_lf = (
+            cells_lf
+            .sort(["count", *column_tuple], descending=[True] + [False] * len(column_tuple), nulls_last=True)
+            .head(max_cells)
+            .select(
+                pl.concat_str(
+                    [_escape(pl.col(col)).fill_null("<null>") for col in column_tuple], separator="|"
+                ).alias("cell"),
+                "count",
+            )
+        )
+        totals_lf = cells_lf.select(
+            pl.len().alias("total_cells"), pl.col("count").sum().alias("total_count")
+        )
+        queries += [top_lf, totals_lf]
+        tuples.append(column_tuple)
+
+    import time
+    start = time.time()
+    results = pl.collect_all(queries)
+
+    for i, column_tuple in enumerate(tuples):
+        top_df, totals_df = results[2 * i], results[2 * i + 1]
+        total_cells = totals_df["total_cells"].item()
+        total_count = totals_df["total_count"].item() or 0
+        kept_count = top_df["count"].sum()
+
+        label = " x ".join(column_tuple)
+        contingency_dict.setdefault(column_tuple[0], {})[label] = {
+            "cells": dict(zip(top_df["cell"].to_list(), top_df["count"].to_list())),
+            "total_cells": total_cells,
+            "total_count": total_count,
+            "overflow": {
+                "cells": total_cells - top_df.height,
+                "count": total_count - kept_count,
+            },
+        }
+        print(f"\n contingency_map for {label}: {total_cells} cells, {max(total_cells - max_cells, 0)} in overflow")
+
+    print(f" contingency_map: {len(tuples)} tables in {time.time() - start:.2f}s.")
+    return contingency_dict
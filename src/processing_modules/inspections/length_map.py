@@ -1,7 +1,13 @@
 import polars as pl
 
+from src.shared.utils import counts_to_dict
+
+# The domain result only depends on each column's value counts, so the processor
+# may pass a value-count table: (counts_lf, [column], "count")
+SUPPORTS_VALUE_COUNTS = True
+
 # TODO: REVISE
-def length_map(data: list | dict[str, any] | tuple[pl.LazyFrame, str], target_values: bool) -> dict[str, any]:
+def length_map(data: list | dict[str, any] | tuple[pl.LazyFrame, str], target_values: bool, by_file: bool = False) -> dict[str, any]:
     """
     Extract a key-length map from a dataframe or dictionary.
 
@@ -43,6 +49,11 @@ def length_map(data: list | dict[str, any] | tuple[pl.LazyFrame, str], target_va
            }
         }
         We would count: {"": 1, "000": 1, "010": 1} to get the frequency of each key length
+
+    For a LazyFrame (domain data), by_file=True groups by 'file_name' in the same
+    query and returns {"all_files": {...}, "by_file": {file_name: {...}}} per column.
+    An optional third tuple element names a weight column, eg. the 'count' column
+    of a value-count table, in which case each row counts 'weight' times.
         
     """
 
@@ -95,7 +106,10 @@ def length_map(data: list | dict[str, any] | tuple[pl.LazyFrame, str], target_va
 
 
     elif isinstance(data, tuple):
-        lf, white_list = data
+        lf, white_list = data[0], data[1]
+        weight = data[2] if len(data) > 2 else None
+        weight_col = [weight] if weight else []
+        count_expr = pl.col(weight).sum() if weight else pl.count()
         length_map = {}
         total_cols = len(white_list)
         lf_schema = lf.collect_schema().names()
@@ -105,17 +119,15 @@ def length_map(data: list | dict[str, any] | tuple[pl.LazyFrame, str], target_va
                 continue
             import time
             start = time.time()
+            file_col = ["file_name"] if by_file else []
             counts_df = (
                 lf
-                .select(pl.col(column).str.len_chars().alias("len"))
-                .group_by("len")
-                .agg(pl.count().alias("counts"))
-                .sort("len")
+                .select(*file_col, *weight_col, pl.col(column).str.len_chars().alias("len"))
+                .group_by(file_col + ["len"])
+                .agg(count_expr.alias("counts"))
                 .collect()
             )
-            length_map[column] = dict(
-                zip(counts_df["len"].to_list(), counts_df["counts"].to_list())
-            )
+            length_map[column] = counts_to_dict(counts_df, "len", "counts", by_file)
             total_cols -= 1
             print(f"\n length_map for {column} {time.time() - start:.2f}s. {total_cols} left")
             print(length_map[column])
@@ -0,0 +1,201 @@
+import math
+
+import polars as pl
+
+SUPPORTS_VALUE_COUNTS = True
+
+DEFAULT_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+def numeric_summary(
+    data: tuple[pl.LazyFrame, list[str]],
+    target_values: bool,
+    by_file: bool = False,
+    quantiles: list[float] | None = None,
+    relative_accuracy: float = 0.01,
+) -> dict[str, any]:
+    """
+    Summarize the numeric content of string columns.
+
+    Values are stripped and cast to Float64 (non-strict). Values that are not
+    missing but do not cast to a finite number are counted as cast failures.
+    Per file, one grouped query computes count, min, max, sum and the sum of squared
+    deviations, and a second one fills a quantile sketch: log-spaced buckets with
+    ratio gamma = (1 + a) / (1 - a), so every quantile is within the relative
+    accuracy a (DDSketch). Both are mergeable - the all-files result is merged
+    from the per-file partials (Chan et al. for the variance, bucket counts are summed).
+
+    Args:
+        data: (lf, white_list) or (lf, white_list, weight), where weight names a
+            column holding how many rows each row stands for (value-count table)
+        target_values: Not used in this inspection
+        by_file: also report the summary per file, nested as
+            {"all_files": {...}, "by_file": {file_name: {...}}}
+        quantiles: Quantiles to report, defaults to DEFAULT_QUANTILES
+        relative_accuracy: Relative accuracy of the quantile sketch
+
+    Returns:
+        {
+            "AG": {
+                "count": 330000, "missing": 0, "cast_failures": 2000,
+                "failure_examples": ["18-30"],
+                "min": 0.0, "max": 4.0, "mean": 2.0, "std": 1.41,
+                "quantiles": {"p1": 0.0, "p5": 0.0, ..., "p99": 4.0}
+            }
+        }
+    """
+    if not isinstance(data, tuple):
+        raise ValueError("numeric_summary is only supported for domain data")
+    if not 0 < relative_accuracy < 1:
+        raise ValueError("relative_accuracy must be between 0 and 1")
+
+    lf, white_list = data[0], data[1]
+    weight = data[2] if len(data) > 2 else None
+    quantiles = quantiles or DEFAULT_QUANTILES
+    log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+
+    summary_dict = {}
+    lf_schema = lf.collect_schema().names()
+    total_cols = len(white_list)
+    for col in white_list:
+        if col not in lf_schema:
+            continue
+        import time
+        start = time.time()
+
+        x = pl.col("x")
+        w = pl.col("w")
+        values_lf = lf.select(
+            "file_name",
+            (pl.col(weight) if weight else pl.lit(1)).cast(pl.Int64).alias("w"),
+            pl.col(col).alias("raw"),
+            pl.col(col).str.strip_chars().cast(pl.Float64, strict=False).alias("x"),
+        ).with_columns(
+            (pl.col("raw").is_null() | (pl.col("raw").str.strip_chars() == "")).alias("missing"),
+            x.is_finite().fill_null(False).alias("numeric"),
+        )
+
+        failed = ~pl.col("missing") & ~pl.col("numeric")
+        mean = (x * w).filter("numeric").sum() / w.filter("numeric").sum()
+        partials_lf = (
+            values_lf
+            .group_by("file_name")
+            .agg(
+                w.filter("numeric").sum().alias("count"),
+                w.filter("missing").sum().alias("missing"),
+                w.filter(failed).sum().alias("cast_failures"),
+                pl.col("raw").filter(failed).unique().sort().head(5).alias("failure_examples"),
+                x.filter("numeric").min().alias("min"),
+                x.filter("numeric").max().alias("max"),
+                (x * w).filter("numeric").sum().alias("sum"),
+                (w * (x - mean) ** 2).filter("numeric").sum().alias("m2"),
+            )
+        )
+        sketch_lf = (
+            values_lf
+            .filter("numeric")
+            .select(
+                "file_name",
+                "w",
+                x.sign().cast(pl.Int8).alias("sign"),
+                pl.when(x == 0)
+                .then(0)
+                .otherwise((x.abs().log() / log_gamma).ceil())
+                .cast(pl.Int32)
+                .alias("bucket"),
+            )
+            .group_by(["file_name", "sign", "bucket"])
+            .agg(w.sum().alias("count"))
+        )
+        partials_df, sketch_df = pl.collect_all([partials_lf, sketch_lf])
+
+        all_files = _summarize(
+            partials_df.to_dicts(), sketch_df, quantiles, log_gamma
+        )
+        if by_file:
+            summary_dict[col] = {
+                "all_files": all_files,
+                "by_file": {
+                    partial["file_name"]: _summarize(
+                        [partial],
+                        sketch_df.filter(pl.col("file_name") == partial["file_name"]),
+                        quantiles,
+                        log_gamma,
+                    )
+                    for partial in sorted(partials_df.to_dicts(), key=lambda p: p["file_name"])
+                },
+            }
+        else:
+            summary_dict[col] = all_files
+
+        total_cols -= 1
+        print(f"\n numeric_summary for {col} {time.time() - start:.2f}s. {total_cols} left")
+        print({k: v for k, v in all_files.items() if k != "quantiles"})
+
+    return summary_dict
+
+
+def _summarize(partials: list[dict[str, any]], sketch_df: pl.DataFrame, quantiles: list[float], log_gamma: float) -> dict[str, any]:
+    """Merge per-file partials and sketch buckets into one summary."""
+    count, total, m2 = 0, 0.0, 0.0
+    for partial in partials:
+        n_b = partial["count"] or 0
+        if n_b == 0:
+            continue
+        # Chan et al. pairwise update of the sum of squared deviations
+        if count:
+            delta = partial["sum"] / n_b - total / count
+            m2 += partial["m2"] + delta ** 2 * count * n_b / (count + n_b)
+        else:
+            m2 = partial["m2"]
+        count += n_b
+        total += partial["sum"]
+
+    examples = sorted({value for partial in partials for value in partial["failure_examples"]})[:5]
+    summary = {
+        "count": count,
+        "missing": sum(partial["missing"] or 0 for partial in partials),
+        "cast_failures": sum(partial["cast_failures"] or 0 for partial in partials),
+        "failure_examples": examples,
+    }
+    if count == 0:
+        return summary
+
+    minimum = min(p["min"] for p in partials if p["min"] is not None)
+    maximum = max(p["max"] for p in partials if p["max"] is not None)
+    summary.update({
+        "min": minimum,
+        "max": maximum,
+        "mean": total / count,
+        "std": math.sqrt(m2 / (count - 1)) if count > 1 else 0.0,
+        "quantiles": _sketch_quantiles(sketch_df, count, quantiles, log_gamma, minimum, maximum),
+    })
+    return summary
+
+
+def _sketch_quantiles(sketch_df: pl.DataFrame, count: int, quantiles: list[float], log_gamma: float, minimum: float, maximum: float) -> dict[str, float]:
+    """Read quantiles from the (merged) log buckets. Negative buckets are ordered by
+    descending magnitude, followed by zero and the positive buckets."""
+    buckets_df = (
+        sketch_df
+        .group_by(["sign", "bucket"])
+        .agg(pl.col("count").sum())
+        .with_columns((pl.col("sign") * pl.col("bucket")).alias("order"))
+        .sort(["sign", "order"])
+        .with_columns(pl.col("count").cum_sum().alias("cum_count"))
+    )
+    gamma = math.exp(log_gamma)
+    signs = buckets_df["sign"].to_list()
+    indexes = buckets_df["bucket"].to_list()
+    cum_counts = buckets_df["cum_count"].to_list()
+
+    result = {}
+    position = 0
+    for q in sorted(quantiles):
+        rank = q * (count - 1)
+        while position < len(cum_counts) - 1 and cum_counts[position] <= rank:
+            position += 1
+        sign, index = signs[position], indexes[position]
+        # Bucket i holds (gamma^(i-1), gamma^i] - its midpoint (by relative error)
+        value = sign * 2 * gamma ** index / (gamma + 1) if sign else 0.0
+        result[f"p{q * 100:g}"] = min(max(value, minimum), maximum)
+    return result
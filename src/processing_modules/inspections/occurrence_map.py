@@ -1,11 +1,47 @@
+import math
+import shutil
+import tempfile
+from pathlib import Path
+
 import polars as pl
-def occurrence_map(data: list | tuple[pl.LazyFrame, list[str]], target_values: bool) -> dict:
+
+from src.shared.utils import counts_to_dict
+
+SUPPORTS_VALUE_COUNTS = True
+
+# Estimated size of one group in the group_by hash table, on top of the value bytes
+GROUP_OVERHEAD_BYTES = 48
+# Larger maps are not printed to the console
+PRINT_MAX_ENTRIES = 50
+
+def occurrence_map(
+    data: list | tuple[pl.LazyFrame, list[str]],
+    target_values: bool,
+    by_file: bool = False,
+    top_k: int | None = None,
+    max_distinct: int | None = None,
+    memory_budget_mb: float | None = None,
+    spill_dir: str | None = None,
+) -> dict:
     """
     Count the occurrences of each unique value in a list.
     
     Args:
         data: A list of values to count occurrences for
         target_values: Not used in this inspection
+        by_file: (LazyFrame only) also group by 'file_name' in the same query and
+            nest the result as {"all_files": {...}, "by_file": {file_name: {...}}}
+        top_k: (LazyFrame only) keep only the top_k most frequent values, the rest
+            is collapsed into '<other>': {"entries": n, "count": sum}
+        max_distinct: (LazyFrame only) columns with more distinct values are
+            reported with summary stats only: {"<summary>": {...}}
+        memory_budget_mb: (LazyFrame only) if the estimated size of a column's
+            distinct set exceeds the budget, the group_by runs in hash partitions
+            that are spilled to parquet files (in spill_dir or a temp folder).
+            Requires top_k or max_distinct, the full map would not fit either
+
+        For LazyFrames, data is (lf, white_list) or (lf, white_list, weight), where
+        weight names a column holding how many rows each row stands for.
     Returns:
         A dictionary mapping each unique value to its number of occurrences
         
@@ -24,8 +60,14 @@ def occurrence_map(data: list | tuple[pl.LazyFrame, list[str]], target_values: b
             occurrence_dict[value] += 1
     
     elif isinstance(data, tuple):
+        if memory_budget_mb and top_k is None and max_distinct is None:
+            raise ValueError("occurrence_map with memory_budget_mb requires top_k or max_distinct")
         
-        lf, white_list = data
+        lf, white_list = data[0], data[1]
+        weight = data[2] if len(data) > 2 else None
+        weight_col = [weight] if weight else []
+        count_expr = pl.col(weight).sum() if weight else pl.count()
+        limited = top_k is not None or max_distinct is not None
         occurrence_dict = {}
         lf_schema = lf.collect_schema().names()
         total_cols = len(white_list)
@@ -35,19 +77,115 @@ def occurrence_map(data: list | tuple[pl.LazyFrame, list[str]], target_values: b
             import time
             start = time.time()
             # Count occurrences of each unique value in the column
-            counts_df = (
-                lf
-                .select(pl.col(col).alias("value"))
-                .group_by("value")
-                .agg(pl.count().alias("count"))
-                .sort("value")
-                .collect()
-            )
-            occurrence_dict[col] = dict(
-                zip(counts_df["value"].to_list(), counts_df["count"].to_list())
-            )
+            file_col = ["file_name"] if by_file else []
+            values_lf = lf.select(*file_col, *weight_col, pl.col(col).alias("value"))
+
+            n_partitions = 1
+            if memory_budget_mb:
+                n_partitions = _spill_partitions(values_lf, memory_budget_mb)
+
+            spill_path = None
+            if n_partitions > 1:
+                spill_path = Path(tempfile.mkdtemp(prefix=f"occurrence_map_{col}_", dir=spill_dir))
+                print(f"\n occurrence_map for {col}: spilling the group_by in {n_partitions} partitions to {spill_path}")
+                # One scan writes the rows of every partition, then each one is grouped on its own
+                rows_path = spill_path / "rows"
+                values_lf.with_columns(
+                    (pl.col("value").hash(seed=0) % n_partitions).alias("partition")
+                ).sink_parquet(
+                    pl.PartitionByKey(rows_path / "part_{key[0].value}.parquet", by="partition", include_key=False),
+                    mkdir=True,
+                    engine="streaming",
+                )
+                for rows_file in rows_path.iterdir():
+                    (
+                        pl.scan_parquet(rows_file)
+                        .group_by(file_col + ["value"])
+                        .agg(count_expr.alias("count"))
+                        .sink_parquet(spill_path / rows_file.name, engine="streaming")
+                    )
+                shutil.rmtree(rows_path)
+                counts_lf = pl.scan_parquet(spill_path / "*.parquet")
+            else:
+                counts_lf = (
+                    values_lf
+                    .group_by(file_col + ["value"])
+                    .agg(count_expr.alias("count"))
+                    .collect()
+                    .lazy()
+                )
+
+            try:
+                if not limited and spill_path is None:
+                    occurrence_dict[col] = counts_to_dict(counts_lf.collect(), "value", "count", by_file)
+                elif by_file:
+                    file_names = counts_lf.select(pl.col("file_name").unique().sort()).collect()["file_name"]
+                    occurrence_dict[col] = {
+                        "all_files": _limited_counts(
+                            counts_lf.group_by("value").agg(pl.col("count").sum()), top_k, max_distinct
+                        ),
+                        "by_file": {
+                            file_name: _limited_counts(
+                                counts_lf.filter(pl.col("file_name") == file_name), top_k, max_distinct
+                            )
+                            for file_name in file_names
+                        },
+                    }
+                else:
+                    occurrence_dict[col] = _limited_counts(counts_lf, top_k, max_distinct)
+            finally:
+                if spill_path is not None:
+                    shutil.rmtree(spill_path, ignore_errors=True)
+
             total_cols -= 1
             print(f"\n occurrence_map for {col} {time.time() - start:.2f}s. {total_cols} left")
-            print(occurrence_dict[col])
+            summary = occurrence_dict[col]["all_files"] if by_file else occurrence_dict[col]
+            if len(summary) <= PRINT_MAX_ENTRIES:
+                print(summary)
+            else:
+                print(f"{len(summary)} entries (not printed)")
         
     return occurrence_dict
+
+
+def _spill_partitions(values_lf: pl.LazyFrame, memory_budget_mb: float) -> int:
+    """Estimate the size of the distinct set (HyperLogLog count times the average
+    value size) and return how many hash partitions keep each one below the budget."""
+    estimate = values_lf.select(
+        pl.col("value").approx_n_unique().alias("distinct"),
+        pl.col("value").str.len_bytes().mean().alias("value_bytes"),
+    ).collect().row(0, named=True)
+
+    distinct_bytes = estimate["distinct"] * ((estimate["value_bytes"] or 0) + GROUP_OVERHEAD_BYTES)
+    return max(1, math.ceil(distinct_bytes / (memory_budget_mb * 1024 ** 2)))
+
+
+def _limited_counts(counts_lf: pl.LazyFrame, top_k: int | None, max_distinct: int | None) -> dict[str, any]:
+    """Turn (value, count) into a map, applying the max_distinct and top_k limits."""
+    stats = counts_lf.select(
+        pl.len().alias("distinct_values"),
+        pl.col("count").sum().alias("total_count"),
+        pl.col("count").filter(pl.col("value").is_null()).sum().alias("null_count"),
+        (pl.col("count") == 1).sum().alias("singletons"),
+        pl.col("count").max().alias("max_count"),
+    ).collect().row(0, named=True)
+
+    if max_distinct is not None and stats["distinct_values"] > max_distinct:
+        return {"<summary>": stats}
+
+    if top_k is not None and stats["distinct_values"] > top_k:
+        top_df = (
+            counts_lf
+            .sort(["count", "value"], descending=[True, False], nulls_last=True)
+            .head(top_k)
+            .collect()
+        )
+        top_map = dict(zip(top_df["value"].to_list(), top_df["count"].to_list()))
+        top_map["<other>"] = {
+            "entries": stats["distinct_values"] - top_df.height,
+            "count": stats["total_count"] - top_df["count"].sum(),
+        }
+        return top_map
+
+    counts_df = counts_lf.sort("value").collect()
+    return dict(zip(counts_df["value"].to_list(), counts_df["count"].to_list()))
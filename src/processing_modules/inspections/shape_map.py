@@ -0,0 +1,97 @@
+import polars as pl
+
+SUPPORTS_VALUE_COUNTS = True
+
+def shape_map(data: tuple[pl.LazyFrame, list[str]], target_values: bool, by_file: bool = False) -> dict[str, any]:
+    """
+    Profile the shape and missingness of the values in each column.
+
+    Every value is mapped to a shape signature: digits become '9', letters
+    become 'A' and all other characters are kept (eg. '12-ab' -> '99-AA').
+    The signatures are counted per column in one grouped query, and the
+    null, empty and whitespace-only counts are derived from the same result.
+
+    Args:
+        data: (lf, white_list) or (lf, white_list, weight), where weight names a
+            column holding how many rows each row stands for (value-count table)
+        target_values: Not used in this inspection
+        by_file: also group by 'file_name' and nest the result as
+            {"all_files": {...}, "by_file": {file_name: {...}}}
+
+    Returns:
+        {
+            "ED": {
+                "shapes": {" ": 12000, "9": 290000, "99": 30000},
+                "null": 0,
+                "empty": 0,
+                "whitespace_only": 12000
+            }
+        }
+    """
+    if not isinstance(data, tuple):
+        raise ValueError("shape_map is only supported for domain data")
+
+    lf, white_list = data[0], data[1]
+    weight = data[2] if len(data) > 2 else None
+    weight_col = [weight] if weight else []
+    count_expr = pl.col(weight).sum() if weight else pl.len()
+
+    def profile(shapes_df: pl.DataFrame) -> dict[str, any]:
+        shapes_df = shapes_df.sort("shape")
+        present_df = shapes_df.filter(pl.col("shape").is_not_null())
+        return {
+            "shapes": dict(zip(present_df["shape"].to_list(), present_df["count"].to_list())),
+            "null": int(shapes_df.filter(pl.col("shape").is_null())["count"].sum()),
+            "empty": int(shapes_df.filter(pl.col("shape") == "")["count"].sum()),
+            "whitespace_only": int(
+                shapes_df.filter(
+                    (pl.col("shape") != "") & (pl.col("shape").str.strip_chars() == "")
+                )["count"].sum()
+            ),
+        }
+
+    shape_dict = {}
+    lf_schema = lf.collect_schema().names()
+    total_cols = len(white_list)
+    for col in white_list:
+        if col not in lf_schema:
+            continue
+        import time
+        start = time.time()
+
+        file_col = ["file_name"] if by_file else []
+        shapes_df = (
+            lf
+            .select(
+                *file_col,
+                *weight_col,
+                pl.col(col)
+                .str.replace_all(r"\d", "9")
+                .str.replace_all(r"\p{L}", "A")
+                .alias("shape"),
+            )
+            .group_by(file_col + ["shape"])
+            .agg(count_expr.alias("count"))
+            .collect()
+        )
+
+        if by_file:
+            shape_dict[col] = {
+                "all_files": profile(shapes_df.group_by("shape").agg(pl.col("count").sum())),
+                "by_file": {
+                    file_name: profile(file_df)
+                    for (file_name,), file_df in sorted(
+                        shapes_df.partition_by("file_name", as_dict=True).items()
+                    )
+                },
+            }
+            summary = shape_dict[col]["all_files"]
+        else:
+            shape_dict[col] = profile(shapes_df)
+            summary = shape_dict[col]
+
+        total_cols -= 1
+        print(f"\n shape_map for {col} {time.time() - start:.2f}s. {total_cols} left")
+        print(summary)
+
+    return shape_dict
@@ -1,11 +1,19 @@
 import csv
 import json
 import importlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import polars as pl
+
 from src.shared.utils import filter_by_whitelist
 from src.shared.utils import export_to_json
 from src.shared.utils import merge_dicts
+from src.shared.export_writers import CsvWriter, ParquetWriter, SqliteWriter
+
+# Formats of the long-format key export (codebook_export.long_format)
+KEY_EXPORT_WRITERS = {"parquet": ParquetWriter, "csv": CsvWriter, "sqlite": SqliteWriter}
 
 
 class CodebookProcessor:
@@ -24,6 +32,9 @@ class CodebookProcessor:
         self.select_parser = cb_injection["select_parser"]
         self.append_new_metadata = cb_injection["append_new_metadata"]
 
+        # Key export options, eg. {"long_format": "parquet", "per_key_files": false, "workers": 8}
+        self.codebook_export = cb_injection.get("codebook_export") or {}
+
     def _check_codebook_path(self) -> Path:
         # if we found that the filtered codebook mirror exists, we use it
         if self.buffer_paths_cb["f_filtered_cb_mirror"].exists():
@@ -207,30 +218,93 @@ class CodebookProcessor:
     # TODO: Let the user decide output format
     #       For now we use csv
     def _export_keys_to_csv_files(self) -> None:
-        """Export key-value pairs to CSV files without using pandas."""
+        """Export key-value pairs to CSV files without using pandas.
+
+        The files are independent, so they are written by a thread pool
+        (codebook_export.workers, default one per CPU).
+        """
         print(self.key_export_ban)
+        workers = int(self.codebook_export.get("workers") or os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="key_export") as pool:
+            futures = [
+                pool.submit(self._export_key_to_csv_file, key, value)
+                for key, value in self.parsed_codebook["data"].items()
+            ]
+            for future in futures:
+                future.result()
+
+    def _export_key_to_csv_file(self, key: str, value: dict[str, any]) -> None:
+        if value and key not in self.key_export_ban:
+            # Create CSV filename
+            csv_path = self.output_paths_cb["key_exports"] / f"{key}.csv"
+            # with open(csv_path, 'w', newline='', encoding='windows-1252') as f:
+            with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                # Write each key-value pair as a row
+                for k, v in value.items():
+                    writer.writerow([k, v])
+            self.logger.info(
+                f"Exported processed keys for {key} to {csv_path}"
+            )
+        else:
+            # Create empty file for keys with no values
+            empty_file_path = (
+                self.output_paths_cb["key_exports"]
+                / f"{key}_no_values.txt"
+            )
+            with open(empty_file_path, "w") as f:
+                f.write("")
+            self.logger.info(f"Excluded {key}. Moving on.")
+
+    def _export_keys_long(self, export_format: str) -> None:
+        """
+        Export all keys into one long-format table (key, code, label), written
+        with the domain data export writers: codebook_keys.parquet/.csv/.sqlite.
+
+        Keys without values get one row with empty code and label, keys in
+        key_export_ban are left out.
+        """
+        if export_format not in KEY_EXPORT_WRITERS:
+            raise ValueError(
+                f"Unknown codebook key export format '{export_format}', use one of {list(KEY_EXPORT_WRITERS)}"
+            )
+
+        keys, codes, labels = [], [], []
         for key, value in self.parsed_codebook["data"].items():
-            if value and key not in self.key_export_ban:
-                # Create CSV filename
-                csv_path = self.output_paths_cb["key_exports"] / f"{key}.csv"
-                # with open(csv_path, 'w', newline='', encoding='windows-1252') as f:
-                with open(csv_path, "w", newline="", encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    # Write each key-value pair as a row
-                    for k, v in value.items():
-                        writer.writerow([k, v])
-                self.logger.info(
-                    f"Exported processed keys for {key} to {csv_path}"
-                )
-            else:
-                # Create empty file for keys with no values
-                empty_file_path = (
-                    self.output_paths_cb["key_exports"]
-                    / f"{key}_no_values.txt"
-                )
-                with open(empty_file_path, "w") as f:
-                    f.write("")
-                self.logger.info(f"Excluded {key}. Moving on.")
+            if key in self.key_export_ban:
+                continue
+            if not value:
+                keys.append(key)
+                codes.append(None)
+                labels.append(None)
+                continue
+            for code, label in value.items():
+                keys.append(key)
+                codes.append(str(code))
+                labels.append(None if label is None else str(label))
+
+        keys_df = pl.DataFrame(
+            {"key": keys, "code": codes, "label": labels},
+            schema={"key": pl.String, "code": pl.String, "label": pl.String},
+        )
+        writer_class = KEY_EXPORT_WRITERS[export_format]
+        writer_options = {"table_name": "codebook_keys"} if writer_class is SqliteWriter else {}
+        writer = writer_class(
+            self.output_paths_cb["key_exports"] / f"codebook_keys.{writer_class.EXTENSION}", **writer_options
+        )
+        try:
+            writer.write(keys_df)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        self.logger.info(
+            f"Exported {keys_df.height} codes of {keys_df['key'].n_unique()} keys to {writer.path}"
+        )
 
     def run_export(self):
-        self._export_keys_to_csv_files()
+        if self.codebook_export.get("per_key_files", True):
+            self._export_keys_to_csv_files()
+        long_format = self.codebook_export.get("long_format")
+        if long_format:
+            self._export_keys_long(long_format)
@@ -1,13 +1,59 @@
 import importlib
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
 from src.shared.utils import export_to_json
 from src.shared.utils import merge_dicts
+from src.shared.utils import inspection_to_long
+from src.shared.utils import export_to_store
+from src.shared.utils import summarize_inspection
+from src.shared.utils import prefetch
+import hashlib
+import math
+import os
 import shutil
 import time
 import json
 
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from src.parsers.domain_parsing_manager import DomainParsingManager
+from src.shared.export_writers import BaseExportWriter, CsvWriter, FeatherWriter, ParquetWriter, SqliteWriter, XlsxWriter
+from src.shared.export_writers import GzipCsvWriter, ZstdCsvWriter
+from src.shared.export_writers import BaseExportRoute, MonolithRoute, NumericRoute, PartitionRoute, TooManyPartitionsError, write_part
+from src.shared.export_writers import SPILL_KEY, SpillFile
+from src.shared.export_writers import CHECKSUM_ALGORITHM, ExportJournal
+from src.shared.external_sort import external_sort
+
+# Rows per batch when the edited table is routed to several output files
+EXPORT_BATCH_ROWS = 100_000
+# Lower bound when the batch size is derived from export_options.memory_budget_mb
+MIN_EXPORT_BATCH_ROWS = 1_000
+# Batches that are read and split ahead, while the current one is written
+EXPORT_PREFETCH_BATCHES = 1
+# Column-value partitioning refuses to write more partitions than this, unless
+# export_options.max_partitions is set
+DEFAULT_MAX_PARTITIONS = 1_000
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+# Output files open at a time, unless export_options.max_open_writers is set
+DEFAULT_MAX_OPEN_WRITERS = 128
+# Share of export_options.memory_budget_mb for the buffers of the open writers
+# (the rest is for the batches), and the least each open writer gets of it
+WRITER_BUDGET_SHARE = 0.5
+MIN_WRITER_MEMORY_MB = 4
+# Estimated size of one (file_name, value) group of the shared value counts, on top of the value bytes
+VALUE_COUNT_GROUP_BYTES = 64
+# Rows per sorted run of export_options.sort_by, if there is no memory_budget_mb
+SORT_RUN_ROWS = 1_000_000
+# Orders of the export_options.sort_by columns, the first one is the default
+SORT_ORDERS = ("numeric", "text")
+# Prefix of the numeric sort keys carried through the sort (dropped from the outputs)
+SORT_KEY_PREFIX = "__pycura_sort_"
+# Rows used to estimate the size of an edited row
+ROW_SIZE_SAMPLE_ROWS = 10_000
 
 
 # These should be moved upstream
@@ -50,6 +96,16 @@ class DomainDataProcessor:
 
         self.dd_inspections = dd_injection["dd_inspections"]
 
+        # Optional long-format (Parquet/Arrow) store for inspection results,
+        # eg. {"format": "parquet", "json_summary": true, "summary_max_entries": 50}.
+        # Without it, the full results are written to JSON only.
+        self.inspection_store = dd_injection.get("inspection_store") or {}
+
+        # Used by inspections that need the codebook (REQUIRES_CODEBOOK), unless
+        # a live codebook is attached via attach_codebook()
+        self.codebook_mirror = dd_injection.get("codebook_mirror")
+        self.codebook = None
+
         #there two have inconsistent naming
         self.domain_exports = dd_injection["output_paths"]["domain_exports"]
         self.output_paths_dd = dd_injection["output_paths"]
@@ -65,8 +121,38 @@ class DomainDataProcessor:
             "output_formats_and_batching", {"csv": "mirror_input"}
         )
 
+        # Per-format writer options, eg. {"parquet": {"compression": "zstd", "row_group_size": 100000}}
+        self.export_options = dd_injection.get("export_options") or {}
+
         self.to_select = []
         self.parsed_table = None
+
+        # Sorted edited table (export_options.sort_by only, Arrow IPC), read back in batches
+        self.export_spool = self.filtered_dd_mirror / "export_spool.arrow"
+        # Unsorted edited table (Arrow IPC), only for edits that are not row-wise (see _iter_edited_batches)
+        self.edited_spool = self.filtered_dd_mirror / "edited_spool.arrow"
+        # Estimated in-memory bytes per edited row (see _row_bytes)
+        self._row_bytes_estimate = None
+        # Input files to export, None for all (set by incremental exports)
+        self.export_files = None
+        # Open writers per partitioned output and memory per writer, None for
+        # no limit (set per export, see _limit_writers)
+        self.partition_open_writers = None
+        self.writer_memory_mb = None
+        # Compression pools shared by the files of a compressed CSV output
+        self.compression_pools = []
+
+        # Applied domain edits as (key, edit, parameters), in order
+        self.edit_history = []
+
+        # Per-column value counts (file_name, column, count) of the last
+        # non-post-transformation inspection run, and the number of edits
+        # that had been applied when they were collected. Columns whose counts
+        # exceed the inspections' memory budget are spilled to parquet files in
+        # value_counts_dir and held as LazyFrames scanning them.
+        self.value_counts = None
+        self.value_counts_edit_index = 0
+        self.value_counts_dir = self.filtered_dd_mirror / "value_counts"
         
         # 
         self.parsing_manager = DomainParsingManager(
@@ -140,6 +226,10 @@ class DomainDataProcessor:
         # Get the inspections to run from the config file
         inspections_to_run = self.dd_inspections
 
+        # Value counts are shared by all inspections that support them and are
+        # collected (or derived) once, on the first inspection that needs them
+        value_counts = None
+
         # Inspection_name (key) is the name of the inspection function
         # The config (value) is the config for the inspection -> better varname
         for inspection_name, config in inspections_to_run.items():
@@ -174,27 +264,80 @@ class DomainDataProcessor:
                 except (ImportError, AttributeError) as e:
                     raise InspectionError(f"Failed to import inspection function '{inspection_name}': {str(e)}")
                 
+                # Inspections flagged with SUPPORTS_VALUE_COUNTS only depend on
+                # each column's value counts and are run on those instead. The value
+                # counts are held in memory, so inspections with a memory budget
+                # (eg. spilling occurrence_map) scan the table themselves
+                use_value_counts = getattr(inspection_module, "SUPPORTS_VALUE_COUNTS", False) \
+                    and not config.get("memory_budget_mb")
+                if use_value_counts and value_counts is None:
+                    value_counts = self._get_value_counts(second_run)
+
                 # ---- GETTING METADATA ----
                 schema = self.parsed_table.collect_schema()
                 n_cols = len(schema.names())
                 
                 try:
-                    n_rows = self.parsed_table.select(pl.count()).collect().item()
+                    if value_counts:
+                        n_rows = next(iter(value_counts.values())).lazy().select(pl.col("count").sum()).collect().item()
+                    else:
+                        n_rows = self.parsed_table.select(pl.count()).collect().item()
                 except Exception as e:
                     self.logger.warning("Error getting row count - setting to '?'")
                     self.logger.error(str(e))
                     n_rows = "?"
                 
+                # ---- INSPECTION OPTIONS ----
+                # Everything besides 'active' is passed on to the inspection,
+                # eg. {"active": true, "by_file": true}
+                inspection_options = {k: v for k, v in config.items() if k != "active"}
+                log_options = dict(inspection_options)
+
+                if getattr(inspection_module, "REQUIRES_CODEBOOK", False):
+                    inspection_options["codebook"] = self._get_codebook()
+
                 # ---- RUNNING INSPECTION ----
                 self.logger.info(f"Running inspection: {inspection_name} on {n_rows} rows and {n_cols} columns")
-                
-                inspection_result = inspection_function(
-                    (self.parsed_table, self.white_list), target_values
-                )
+                if log_options:
+                    self.logger.info(f" -> INSPECTION OPTIONS: {log_options}")
+
+                if use_value_counts:
+                    inspection_result = {}
+                    for column, counts_df in value_counts.items():
+                        inspection_result.update(
+                            inspection_function(
+                                (counts_df.lazy(), [column], "count"), target_values, **inspection_options
+                            )
+                        )
+                else:
+                    inspection_result = inspection_function(
+                        (self.parsed_table, self.white_list), target_values, **inspection_options
+                    )
+
+                # ---- EXPORTING RESULTS ----
+                json_result = inspection_result
+                if self.inspection_store:
+                    phase = "processed" if second_run else "original"
+                    store_path = export_to_store(
+                        inspection_to_long(inspection_result, inspection_name, phase),
+                        self.output_paths_dd["inspection"],
+                        f"{inspection_tag}.{phase}",
+                        self.inspection_store.get("format", "parquet"),
+                    )
+                    self.logger.info(f" -> EXPORTED {inspection_tag} ({phase}) TO {store_path}")
+
+                    if not self.inspection_store.get("json_summary", True):
+                        continue
+                    # Inspections flagged with BOUNDED_OUTPUT cap their maps and
+                    # keep their own overflow bucket, they go to the JSON as they are
+                    if not getattr(inspection_module, "BOUNDED_OUTPUT", False):
+                        json_result = summarize_inspection(
+                            inspection_result, int(self.inspection_store.get("summary_max_entries", 50))
+                        )
 
                 # Merge results with existing data
                 merged = merge_dicts(
-                    getattr(self, inspection_tag), inspection_result, subkey_tag
+                    getattr(self, inspection_tag), json_result, subkey_tag
                 )
 
                 setattr(self, inspection_tag, merged)
@@ -214,6 +357,181 @@ class DomainDataProcessor:
                 self.logger.error(f"Error running inspection '{inspection_name}': {str(e)}")
                 # Continue with next inspection rather than failing the entire process
                 continue
+
+    def attach_codebook(self, parsed_codebook: dict[str, any]) -> None:
+        """Use the (live) codebook of a CodebookProcessor for inspections, so
+        post-transformation inspections see the edited codebook keys."""
+        self.codebook = parsed_codebook
+
+    def _get_codebook(self) -> dict[str, any]:
+        """Return the attached codebook, or load the filtered codebook mirror."""
+        if self.codebook is not None:
+            return self.codebook
+
+        if self.codebook_mirror is None or not self.codebook_mirror.exists():
+            raise InspectionError(
+                "No parsed codebook available. Parse the codebook first (target 'cb' or 'both')"
+            )
+
+        self.logger.info(f" -> LOADING CODEBOOK FROM {self.codebook_mirror} (UNEDITED)")
+        with open(self.codebook_mirror, "r", encoding="utf-8") as f:
+            self.codebook = json.load(f)
+        return self.codebook
+
+    def _collect_value_counts(self, lazy_frame: pl.LazyFrame, columns: list[str], phase: str) -> dict[str, pl.DataFrame | pl.LazyFrame]:
+        """
+        Count (file_name, value) pairs for each column. All columns that fit in
+        memory are collected together, so the common scan is only executed once.
+
+        If an active inspection sets memory_budget_mb, columns whose estimated
+        distinct (file_name, value) set exceeds the (smallest) budget are counted
+        in hash partitions, spilled to value_counts_dir/<phase>/<column>, and
+        returned as a LazyFrame over those files - like occurrence_map's spill.
+        The table is scanned once per spilled column, whatever the partitions.
+        """
+        if not columns:
+            return {}
+
+        n_partitions = dict.fromkeys(columns, 1)
+        budgets = [
+            config["memory_budget_mb"] for config in self.dd_inspections.values()
+            if config.get("active") and config.get("memory_budget_mb")
+        ]
+        if budgets:
+            n_partitions = self._value_count_partitions(lazy_frame, columns, min(budgets))
+
+        value_counts = {}
+        in_memory = [column for column in columns if n_partitions[column] == 1]
+        queries = [
+            lazy_frame.group_by(["file_name", column]).agg(pl.len().alias("count"))
+            for column in in_memory
+        ]
+        value_counts.update(zip(in_memory, pl.collect_all(queries)))
+
+        for column in columns:
+            if n_partitions[column] == 1:
+                continue
+            spill_path = self.value_counts_dir / phase / quote(column, safe="")
+            shutil.rmtree(spill_path, ignore_errors=True)
+            spill_path.mkdir(parents=True)
+            self.logger.info(
+                f" -> VALUE COUNTS OF {column} EXCEED THE MEMORY BUDGET, "
+                f"SPILLING {n_partitions[column]} PARTITIONS TO {spill_path}"
+            )
+            # One scan writes the (file_name, value) rows of every partition, then
+            # each partition is counted from its own file
+            rows_path = spill_path / "rows"
+            lazy_frame.select(
+                "file_name", column, (pl.col(column).hash(seed=0) % n_partitions[column]).alias("partition")
+            ).sink_parquet(
+                pl.PartitionByKey(rows_path / "part_{key[0].value}.parquet", by="partition", include_key=False),
+                mkdir=True,
+                engine="streaming",
+            )
+            for rows_file in rows_path.iterdir():
+                (
+                    pl.scan_parquet(rows_file)
+                    .group_by(["file_name", column])
+                    .agg(pl.len().alias("count"))
+                    .sink_parquet(spill_path / rows_file.name, engine="streaming")
+                )
+            shutil.rmtree(rows_path)
+            value_counts[column] = pl.scan_parquet(spill_path / "*.parquet")
+
+        return {column: value_counts[column] for column in columns}
+
+    @staticmethod
+    def _value_count_partitions(lazy_frame: pl.LazyFrame, columns: list[str], memory_budget_mb: float) -> dict[str, int]:
+        """Estimate the size of each column's distinct (file_name, value) set in one
+        scan (HyperLogLog count times the average value size) and return how many
+        hash partitions keep each one below the budget."""
+        estimate = lazy_frame.select(
+            *[pl.struct("file_name", column).hash().approx_n_unique().alias(f"{column}:distinct") for column in columns],
+            *[pl.col(column).str.len_bytes().mean().alias(f"{column}:bytes") for column in columns],
+        ).collect().row(0, named=True)
+
+        budget_bytes = memory_budget_mb * 1024 ** 2
+        return {
+            column: max(1, math.ceil(
+                estimate[f"{column}:distinct"] * ((estimate[f"{column}:bytes"] or 0) + VALUE_COUNT_GROUP_BYTES) / budget_bytes
+            ))
+            for column in columns
+        }
+
+    def _derive_value_counts(self, columns: list[str]) -> tuple[dict[str, pl.DataFrame], list[str]]:
+        """
+        Derive post-edit value counts from the stored pre-edit value counts.
+
+        Element-wise edits (edit modules with ELEMENTWISE = True) are pure functions
+        of the cell value, so replaying them on the (small) value-count table and
+        re-aggregating gives the same counts as scanning the edited table.
+
+        Returns:
+            The derived value counts, and the columns that still need a scan (new
+            columns, or columns touched by a non element-wise edit)
+        """
+        new_edits = self.edit_history[self.value_counts_edit_index:]
+
+        derived_queries = {}
+        to_scan = []
+        for column in columns:
+            column_edits = [(edit, parameters) for key, edit, parameters in new_edits if key == column]
+            edit_modules = [self._import_edit(edit)[0] for edit, _ in column_edits]
+
+            # Spilled counts are counted again (with the spill) rather than derived in memory
+            if not isinstance(self.value_counts.get(column), pl.DataFrame) or not all(
+                getattr(edit_module, "ELEMENTWISE", False) for edit_module in edit_modules
+            ):
+                to_scan.append(column)
+                continue
+
+            counts_lf = self.value_counts[column].lazy()
+            for edit, parameters in column_edits:
+                counts_lf = self._import_edit(edit)[1]((counts_lf, column), *parameters)
+
+            derived_queries[column] = (
+                counts_lf
+                .group_by(["file_name", column])
+                .agg(pl.col("count").sum())
+            )
+
+        derived = dict(zip(derived_queries.keys(), pl.collect_all(list(derived_queries.values()))))
+        return derived, to_scan
+
+    def _get_value_counts(self, second_run: bool) -> dict[str, pl.DataFrame]:
+        """Value counts of all whitelisted columns for the current inspection phase."""
+        schema_names = self.parsed_table.collect_schema().names()
+        columns = [column for column in self.white_list if column in schema_names]
+
+        if second_run and self.value_counts is not None:
+            derived, to_scan = self._derive_value_counts(columns)
+            if derived:
+                self.logger.info(f" -> DERIVED PROCESSED VALUE COUNTS FROM PRE-EDIT COUNTS: {list(derived.keys())}")
+        else:
+            derived, to_scan = {}, columns
+
+        if to_scan:
+            self.logger.info(f" -> COLLECTING VALUE COUNTS (SINGLE SCAN): {to_scan}")
+        scanned = self._collect_value_counts(self.parsed_table, to_scan, "processed" if second_run else "original")
+
+        value_counts = {column: derived.get(column, scanned.get(column)) for column in columns}
+
+        if not second_run:
+            self.value_counts = value_counts
+            self.value_counts_edit_index = len(self.edit_history)
+
+        return value_counts
+
+    def _import_edit(self, edit):
+        """Import an edit module and return it together with its edit function."""
+        try:
+            edit_module = importlib.import_module(
+                f"{self.module_paths['edits']}.{edit}"
+            )
+            edit_function = getattr(edit_module, f"{edit}")
+        except (ImportError, AttributeError) as e:
+            raise EditError(f"Failed to import edit function '{edit}': {str(e)}")
+        return edit_module, edit_function
     
     def run_edit(self, key, edit, parameters):
         """Apply an edit function to the parsed data."""
@@ -224,13 +542,7 @@ class DomainDataProcessor:
         
         try:
             # Import the edit module
-            try:
-                edit_module = importlib.import_module(
-                    f"{self.module_paths['edits']}.{edit}"
-                )
-                edit_function = getattr(edit_module, f"{edit}")
-            except (ImportError, AttributeError) as e:
-                raise EditError(f"Failed to import edit function '{edit}': {str(e)}")
+            _, edit_function = self._import_edit(edit)
 
             # Validate parameters
             if not isinstance(parameters, (list, tuple)):
@@ -247,6 +559,7 @@ class DomainDataProcessor:
                 raise EditError(f"Edit function '{edit}' did not return a LazyFrame")
                 
             self.parsed_table = result
+            self.edit_history.append((key, edit, list(parameters)))
             
             # Update whitelist if a new column was added
             if edit == "append_column" and key not in self.white_list:
@@ -277,32 +590,49 @@ class DomainDataProcessor:
         self.logger.info("Note: pyCura_id and file_name are only exported if specified in the config file.")
         self._print_table_metadata()
 
-    def run_export(self):
-        """Export the processed domain data."""
+    def run_export(self, resume: bool = False):
+        """Export the processed domain data.
+
+        Args:
+            resume: continue an interrupted export, keeping the files it completed
+        """
         if self.parsed_table is None:
             raise ExportError("Cannot export: No parsed data available")
             
         try:
-            self._export_domain_data()
+            self._export_domain_data(resume)
         except Exception as e:
             self.logger.error(f"Error during export: {str(e)}")
             raise ExportError(f"Failed to export domain data: {str(e)}") from e
 
     # -----------------------------------------------------------------------------------------------------
-    def _export_domain_data(self):
+    def _export_domain_data(self, resume: bool = False):
         """
         Export domain data in specified formats with specified batching strategies.
         
         Supports multiple formats:
         - csv: Standard CSV format
+        - csv.gz, csv.zst: CSV compressed with gzip / zstd
         - parquet: Apache Parquet columnar format
         - feather: Apache Arrow Feather format
+        - xlsx: Excel workbook
+        - sqlite: SQLite database
         
         Supports multiple batching strategies:
         - monolith: All data in a single file
         - mirror_input: One output file per input file
         - numeric value (e.g., "100000"): Partition by row count
+        - column name(s) (e.g., "AG" or "AG,SE"): Partition by column values
+
+        Files are written under temporary names and renamed when complete; each
+        completed file is recorded in domain_exports/export_journal.jsonl until
+        the export finishes, so an interrupted export can be resumed.
         """
+        routes = {}
+        # A spool left behind by a killed export is stale
+        self.export_spool.unlink(missing_ok=True)
+        self.edited_spool.unlink(missing_ok=True)
+        self._row_bytes_estimate = None
         try:
             # Load ingestion tracker
             tracker_path = self.filtered_dd_mirror / "ingestion_tracker.json"
@@ -325,26 +655,80 @@ class DomainDataProcessor:
             # DEBUG
             #self.logger.info(self.lazy_df.explain(streaming=True))
 
-            # Process each format and batching strategy
+            # Outputs that are not written again: unchanged since the previous
+            # export (incremental, see _plan_incremental) or completed before an
+            # interruption (resume, see _resumable_outputs)
+            previous_manifest = self._load_manifest() if self.export_options.get("incremental") else None
+            journal = ExportJournal(self.domain_exports / "export_journal.jsonl")
+            journal_header = {
+                "config_hash": self._config_hash(),
+                "inputs": {file_name: metadata["checksum"] for file_name, metadata in sorted(ingestion_tracker.items())},
+            }
+            resumed = self._resumable_outputs(journal, journal_header, resume)
+            kept_outputs = []
+            skipped_inputs = {}
+            self.export_files = None
+
+            # Build one route per format and batching strategy
+            route_methods = {}
             for format_name, batching in self.output_formats_and_batching.items():
-                start = time.time()
-                self.logger.info(f"\n --- EXPORTING AS {format_name.upper()} WITH {batching} BATCHING ---")
-                
+                # Call the appropriate format-specific route builder
+                # Could be csv, csv.gz, csv.zst, parquet, feather, xlsx, sqlite
+                route_method = getattr(self, f"_{format_name.lower().replace('.', '_')}_route", None)
+                if route_method is None:
+                    self.logger.warning(f"Unknown format: {format_name}. Skipping export.")
+                    continue
+
+                skipped = set()
+                if previous_manifest is not None:
+                    kept, skipped = self._plan_incremental(
+                        previous_manifest, format_name, str(batching), ingestion_tracker
+                    )
+                    kept_outputs += kept
+                    if skipped == set(ingestion_tracker):
+                        self.logger.info(f" -> {format_name.upper()} ({batching}) is up to date, skipping")
+                        continue
+
+                done = resumed.get((format_name, str(batching)), [])
+                if str(batching) == "monolith" and done:
+                    kept_outputs += done
+                    self.logger.info(f" -> {format_name.upper()} ({batching}) was completed before, skipping")
+                    continue
+                if str(batching) == "mirror_input":
+                    skipped |= {entry["inputs"][0] for entry in done}
+                    if skipped == set(ingestion_tracker):
+                        kept_outputs += done
+                        self.logger.info(f" -> {format_name.upper()} ({batching}) was completed before, skipping")
+                        continue
+
+                skipped_inputs[(format_name, batching)] = skipped
+                route_methods[(format_name, batching)] = route_method
+
+            # Only read the input files that are still needed (mirror_input outputs)
+            if route_methods:
+                needed = set.union(*[set(ingestion_tracker) - skipped for skipped in skipped_inputs.values()])
+                if needed != set(ingestion_tracker):
+                    self.export_files = sorted(needed)
+            self._limit_writers([str(batching) for _, batching in route_methods])
+
+            for (format_name, batching), route_method in route_methods.items():
                 # Create format-specific directory
                 format_dir = self.domain_exports / format_name
                 format_dir.mkdir(exist_ok=True, parents=True)
-                
-                # Call the appropriate format-specific export function
-                # Could be csv, parquet, feather
-                export_method = getattr(self, f"_export_{format_name.lower()}", None)
-                if export_method is None:
-                    self.logger.warning(f"Unknown format: {format_name}. Skipping export.")
-                    continue
                     
-                export_method(format_dir, batching, ingestion_tracker)
+                route = route_method(format_dir, str(batching), ingestion_tracker)
+                routes[(format_name, batching)] = route
+                if skipped_inputs[(format_name, batching)]:
+                    route.exclude = {(file_name,) for file_name in skipped_inputs[(format_name, batching)]}
+                kept_outputs += self._resume_route(route, resumed.get((format_name, str(batching)), []))
+                route.on_commit = lambda key, writer, format_name=format_name, batching=str(batching): journal.record(
+                    {**self._manifest_entry(format_name, batching, key, writer, ingestion_tracker), "partition": key}
+                )
 
-                end = time.time()
-                self.logger.info(f"Exporting as {format_name.upper()} with {batching} batching took {end - start:.2f} seconds")
+            if routes:
+                self._fan_out(routes, ingestion_tracker)
+            self._write_manifest(routes, ingestion_tracker, kept_outputs)
+            journal.remove()
                 
             self.logger.info(" -> DOMAIN DATA EXPORTED TO DATA_OUT FOLDER")
             
@@ -352,127 +736,828 @@ class DomainDataProcessor:
             self.logger.error(f"Error in _export_domain_data: {str(e)}")
             raise ExportError(f"Failed to export domain data: {str(e)}") from e
 
-        
+        finally:
+            # Drops the temporary files of outputs that were not committed
+            for route in routes.values():
+                route.abort()
+            for pool in self.compression_pools:
+                pool.shutdown()
+            self.compression_pools = []
+            self.export_spool.unlink(missing_ok=True)
+            self.edited_spool.unlink(missing_ok=True)
+
+    def _resume_route(self, route: BaseExportRoute, done: list[dict[str, any]]) -> list[dict[str, any]]:
+        """
+        Continue a route after the outputs that an interrupted export completed:
+        row-count batches continue after the last complete batch, partitions
+        (including mirror_input) skip the complete ones.
+
+        Returns:
+            The manifest entries of the outputs that are kept
+        """
+        if not done:
+            return []
+
+        if isinstance(route, NumericRoute):
+            completed = {entry["partition"] for entry in done}
+            n_batches = 0
+            while n_batches + 1 in completed:
+                n_batches += 1
+            route.skip_batches(n_batches)
+            done = [entry for entry in done if entry["partition"] <= n_batches]
+        elif isinstance(route, PartitionRoute):
+            route.exclude |= {tuple(entry["partition"]) for entry in done}
+
+        return [{k: v for k, v in entry.items() if k != "partition"} for entry in done]
+
+    def _export_frame(self, with_file_name: bool = False) -> pl.LazyFrame:
+        """
+        The edited table to export, built on a streaming-capable source.
+
+        The streaming engine of polars 1.26 cannot run on pl.scan_iceberg, so the
+        iceberg data files are scanned directly and the applied edits are replayed
+        on top - the same plan as self.parsed_table.
+
+        Args:
+            with_file_name: also keep 'file_name', to route rows to their input file
+        """
+        return self._apply_export_plan(self.parsing_manager.scan_data_files(), with_file_name)
+
+    def _apply_export_plan(self, lazy_frame: pl.LazyFrame, with_file_name: bool) -> pl.LazyFrame:
+        """Replay the applied edits, keep the exported input files and select the columns."""
+        for key, edit, parameters in self.edit_history:
+            _, edit_function = self._import_edit(edit)
+            lazy_frame = edit_function((lazy_frame, key), *parameters)
+
+        if self.export_files is not None:
+            lazy_frame = lazy_frame.filter(pl.col("file_name").is_in(self.export_files))
+
+        columns = list(self.to_select)
+        if with_file_name and "file_name" not in columns:
+            columns.append("file_name")
+        return lazy_frame.select(columns)
+
+    def _edits_rowwise(self) -> bool:
+        """Whether every applied edit maps each row to one row, from that row
+        alone (edit modules with ROWWISE = True, element-wise edits are too)."""
+        edit_modules = [self._import_edit(edit)[0] for _, edit, _ in self.edit_history]
+        return all(
+            getattr(edit_module, "ROWWISE", False) or getattr(edit_module, "ELEMENTWISE", False)
+            for edit_module in edit_modules
+        )
+
+    def _iter_edited_batches(self, batch_size: int) -> Iterator[pl.DataFrame]:
+        """
+        Yield the edited table (with 'file_name') batch by batch, in the row
+        order of _export_frame(). Batches may be shorter than batch_size.
+
+        If all edits are row-wise (see _edits_rowwise), the table is not
+        materialized: the iceberg data files are read in record batches of
+        batch_size rows (in ingestion order) and the export plan is applied to
+        each one, which gives exactly the rows of _export_frame(). An edit that
+        filters, aggregates or looks at other rows (windows) needs the whole
+        table, so the plan is then run once on it, into the edited spool, and
+        the spool is read in batches.
+        """
+        if not self._edits_rowwise():
+            if not self.edited_spool.exists():
+                start = time.time()
+                self._export_frame(with_file_name=True).sink_ipc(
+                    self.edited_spool, compression=None, engine="streaming"
+                )
+                self.logger.info(
+                    f" -> EDITS ARE NOT ALL ROW-WISE, EDITED TABLE SPOOLED TO {self.edited_spool} "
+                    f"({time.time() - start:.2f}s)"
+                )
+            with pa.memory_map(str(self.edited_spool)) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    record_batch = reader.get_batch(i)
+                    for offset in range(0, record_batch.num_rows, batch_size):
+                        yield pl.from_arrow(record_batch.slice(offset, batch_size))
+            return
+
+        for data_file in self.parsing_manager.data_files():
+            for record_batch in pq.ParquetFile(data_file).iter_batches(batch_size=batch_size):
+                batch_df = self._apply_export_plan(pl.from_arrow(record_batch).lazy(), with_file_name=True).collect()
+                if batch_df.height:
+                    yield batch_df
+
+    def _row_bytes(self) -> float:
+        """Estimated in-memory size of an edited row, from the first rows."""
+        if self._row_bytes_estimate is None:
+            sample_df = self._export_frame(with_file_name=True).head(ROW_SIZE_SAMPLE_ROWS).collect()
+            self._row_bytes_estimate = sample_df.estimated_size() / max(sample_df.height, 1)
+        return self._row_bytes_estimate
+
+    def _sort_columns(self) -> dict[str, str]:
+        """
+        The columns of export_options["sort_by"] with their order: "pyCura_id",
+        "AG,SE" or a list sort every column "numeric", a table (eg.
+        {"pyCura_id": "numeric", "NAME": "text"}) sets the order per column.
+        """
+        sort_by = self.export_options.get("sort_by") or []
+        if isinstance(sort_by, str):
+            sort_by = sort_by.split(",")
+        if not isinstance(sort_by, dict):
+            sort_by = {column: SORT_ORDERS[0] for column in sort_by}
+        sort_by = {column.strip(): order for column, order in sort_by.items() if column.strip()}
+
+        available = self.to_select + ["file_name"]
+        unknown = [column for column in sort_by if column not in available]
+        if unknown:
+            raise ExportError(f"Unknown export_options.sort_by columns: {unknown}")
+        invalid = {column: order for column, order in sort_by.items() if order not in SORT_ORDERS}
+        if invalid:
+            raise ExportError(f"Invalid export_options.sort_by orders: {invalid}, expected one of {list(SORT_ORDERS)}")
+        return sort_by
+
+    @staticmethod
+    def _sort_keys(sort_by: dict[str, str]) -> tuple[list[pl.Expr], list[str]]:
+        """
+        The key columns to add to the edited batches and the columns to sort by.
+
+        The cells are text, so a "numeric" column gets a Float64 key of its value
+        (null for cells that are not numbers), followed by the text itself: numbers
+        sort by value, the other cells (as text) before them. A "text" column
+        sorts by its text.
+        """
+        key_exprs, keys = [], []
+        for i, (column, order) in enumerate(sort_by.items()):
+            if order == "numeric":
+                key = f"{SORT_KEY_PREFIX}{i}"
+                key_exprs.append(pl.col(column).cast(pl.Float64, strict=False).fill_nan(None).alias(key))
+                keys.append(key)
+            keys.append(column)
+        return key_exprs, keys
+
+    def _sort_export_frame(self, sort_by: dict[str, str]) -> Path:
+        """
+        Sort the edited table by sort_by (ascending, nulls first, ties in input
+        order, see _sort_keys) into the export spool - the only case where the
+        table is written to the buffer folder, since no row can be exported
+        before all are read. The numeric keys are part of the spool.
+
+        Runs (see _sort_run_rows) are sorted and spilled to the buffer folder,
+        then merged.
+        """
+        start = time.time()
+        key_exprs, keys = self._sort_keys(sort_by)
+        run_rows = self._sort_run_rows(8 * len(key_exprs))
+
+        batches = (
+            batch_df.with_columns(key_exprs)
+            for batch_df in self._iter_edited_batches(min(run_rows, EXPORT_BATCH_ROWS))
+        )
+        sorted_spool = self.export_spool.with_name(f".sorted_{self.export_spool.name}")
+        try:
+            n_runs = external_sort(
+                batches,
+                sorted_spool,
+                keys,
+                run_rows,
+                self.filtered_dd_mirror,
+            )
+            if n_runs:
+                os.replace(sorted_spool, self.export_spool)
+        finally:
+            sorted_spool.unlink(missing_ok=True)
+        self.logger.info(
+            f" -> EDITED TABLE SORTED BY {sort_by} INTO {self.export_spool} "
+            f"({n_runs} runs of up to {run_rows} rows, {time.time() - start:.2f}s)"
+        )
+        return self.export_spool
+
+    def _sort_run_rows(self, extra_row_bytes: int = 0) -> int:
+        """Rows per sorted run of the external sort: SORT_RUN_ROWS, or as many
+        as fit in a third of export_options["memory_budget_mb"] (a run is held
+        about three times while sorting), for rows of extra_row_bytes more
+        than an edited row."""
+        memory_budget_mb = self.export_options.get("memory_budget_mb")
+        if not memory_budget_mb:
+            return SORT_RUN_ROWS
+        row_bytes = self._row_bytes() + extra_row_bytes
+        return max(MIN_EXPORT_BATCH_ROWS, int(memory_budget_mb * 1024 ** 2 / (row_bytes * 3)))
+
+    def _iter_sorted_batches(self, sort_by: dict[str, str]) -> Iterator[pl.DataFrame]:
+        """Yield the sorted edited table from the (memory-mapped) export spool,
+        without the numeric sort keys."""
+        if not self.export_spool.exists():
+            self._sort_export_frame(sort_by)
+            if not self.export_spool.exists():
+                return  # no rows
+
+        with pa.memory_map(str(self.export_spool)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield pl.from_arrow(reader.get_batch(i)).select(pl.exclude(f"^{SORT_KEY_PREFIX}.*$"))
+
+    def _iter_export_batches(self, batch_size: int) -> Iterator[pl.DataFrame]:
+        """
+        Yield the edited table (with 'file_name') in DataFrames of exactly
+        batch_size rows (the last one may be shorter), streamed from the data
+        files (or read from the sorted spool, with export_options["sort_by"]).
+        At most about one output batch is held in memory at a time.
+        """
+        if batch_size < 1:
+            raise ValueError(f"Batch size must be positive, got {batch_size}")
+
+        sort_by = self._sort_columns()
+        if sort_by:
+            batches = self._iter_sorted_batches(sort_by)
+        else:
+            batches = self._iter_edited_batches(batch_size)
+
+        pending, pending_rows = [], 0
+        for batch_df in batches:
+            while batch_df.height:
+                take = min(batch_size - pending_rows, batch_df.height)
+                pending.append(batch_df.slice(0, take))
+                pending_rows += take
+                batch_df = batch_df.slice(take)
+
+                if pending_rows == batch_size:
+                    yield pl.concat(pending, rechunk=False)
+                    pending, pending_rows = [], 0
+
+        if pending_rows:
+            yield pl.concat(pending, rechunk=False)
+
+    def _fan_out(self, routes: dict[tuple[str, str], BaseExportRoute], ingestion_tracker: dict[str, any]) -> None:
+        """
+        Feed every batch of the edited table to all routes.
+
+        The edited table is streamed in batches (see _iter_export_batches),
+        computed once for all routes - even a single output goes through the
+        writers, which hash the bytes on their way to disk (see manifest.json).
+        Each batch is split by every route into parts for its output files, and
+        all parts are written by a pool of export_options["workers"] threads (default: one per CPU) - the writers
+        release the GIL while encoding and writing, so independent files (formats,
+        partitions, input files) are written concurrently. All parts of a batch
+        are written before the parts of the next batch are submitted, so the rows
+        of every file stay in order.
+
+        Partitioned outputs keep at most _limit_writers' number of files open;
+        the rows of the partitions beyond it are spilled and written after the
+        pass (see _write_spilled).
+
+        The export is a three-stage pipeline: reading and editing the batches
+        (or sorting them) runs on one background thread, splitting them into
+        parts on another, and the parts are written by the pool. So batch k+2 is
+        read while batch k+1 is split and the parts of batch k are written, with
+        at most EXPORT_PREFETCH_BATCHES batches waiting between two stages (see
+        _export_batch_rows).
+        """
+        start = time.time()
+        for format_name, batching in routes:
+            self.logger.info(f"\n --- EXPORTING AS {format_name.upper()} WITH {batching} BATCHING ---")
+
+        workers = int(self.export_options.get("workers") or os.cpu_count() or 1)
+        if workers < 1:
+            raise ExportError(f"export_options.workers must be positive, got {workers}")
+        batch_rows = self._export_batch_rows(len(routes))
+        self.logger.info(f" -> {workers} export workers, {batch_rows} rows per batch")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export") as pool:
+            try:
+                self._write_parts(pool, self._split_batches(routes, batch_rows))
+            except TooManyPartitionsError as e:
+                raise ExportError(f"{e}. Raise export_options.max_partitions to allow it.") from e
+
+            # The remaining files are only committed by a complete pass (mirror_input
+            # files are as soon as the batches are past them). On errors the pool
+            # finishes the running parts and _export_domain_data aborts.
+            writers = [writer for route in routes.values() for writer in route.writers.values()]
+            for future in [pool.submit(writer.close) for writer in writers]:
+                future.result()
+
+            # Partitions beyond the open files of their output (see _limit_writers)
+            for (format_name, batching), route in routes.items():
+                spill = route.spilled()
+                if spill is not None:
+                    self._write_spilled(pool, format_name, batching, route, spill)
+
+        self._log_routes(routes, ingestion_tracker, start)
+
+    @staticmethod
+    def _write_parts(pool: ThreadPoolExecutor, batches: Iterator[list[tuple[BaseExportWriter, pl.DataFrame, bool]]]) -> None:
+        """Write the parts of every batch on the pool, batch after batch (the
+        batches are produced ahead, on a background thread)."""
+        futures = []
+        for parts in prefetch(batches, EXPORT_PREFETCH_BATCHES):
+            for future in futures:
+                future.result()
+            futures = [pool.submit(write_part, writer, part_df, close) for writer, part_df, close in parts]
+        for future in futures:
+            future.result()
+
+    def _write_spilled(self, pool: ThreadPoolExecutor, format_name: str, batching: str, route: PartitionRoute, spill: SpillFile) -> None:
+        """
+        Write the partitions a route spilled because it had reached its open
+        files: the spill is sorted by partition out of core (stable, so the rows
+        of every partition keep their order) and written partition after
+        partition, one file open at a time. This costs one write and read of
+        the spilled rows, instead of another pass over the table.
+        """
+        start = time.time()
+        sorted_spill = spill.path.with_name(f".sorted_{spill.path.name}")
+        try:
+            run_rows = self._sort_run_rows(8)
+            external_sort(spill.batches(), sorted_spill, [SPILL_KEY], run_rows, self.filtered_dd_mirror)
+            spill.remove()
+
+            def sorted_batches() -> Iterator[list[tuple[BaseExportWriter, pl.DataFrame, bool]]]:
+                with pa.memory_map(str(sorted_spill)) as source:
+                    reader = pa.ipc.open_file(source)
+                    for i in range(reader.num_record_batches):
+                        yield route.split_spilled(pl.from_arrow(reader.get_batch(i)))
+
+            self._write_parts(pool, sorted_batches())
+            route.close()
+        finally:
+            sorted_spill.unlink(missing_ok=True)
+        self.logger.info(
+            f" -> {format_name.upper()} ({batching}): {len(route.spill_keys)} partitions beyond "
+            f"{route.max_open} open files spilled ({spill.rows_written} rows) and written "
+            f"after the pass ({time.time() - start:.2f}s)"
+        )
+
+    def _log_routes(self, routes: dict[tuple[str, str], BaseExportRoute], ingestion_tracker: dict[str, any], start: float) -> None:
+        """Log the written files of every route."""
+        for (format_name, batching), route in routes.items():
+            written = [writer for writer in route.writers.values() if writer.checksum is not None]
+            for writer in written:
+                self.logger.info(f"Exported {writer.path} ({writer.rows_written} rows)")
+            self.logger.info(
+                f"{format_name.upper()} export completed using {batching} batching "
+                f"({len(written)} files, {route.rows_written} rows)"
+            )
+            if batching == "mirror_input":
+                for file_name in ingestion_tracker:
+                    if (file_name,) not in route.writers and (file_name,) not in route.exclude:
+                        self.logger.warning(f"No rows left for {file_name} - no output file written")
+
+        self.logger.info(f"Exporting {len(routes)} format(s) took {time.time() - start:.2f} seconds")
+
+    def _split_batches(self, routes: dict[tuple[str, str], BaseExportRoute], batch_rows: int) -> Iterator[list[tuple[BaseExportWriter, pl.DataFrame, bool]]]:
+        """The parts of every batch, split by all routes (in batch order, as the
+        routes assign file names while splitting). The batches are produced
+        on their own background thread, ahead of the split."""
+        for batch_df in prefetch(self._iter_export_batches(batch_rows), EXPORT_PREFETCH_BATCHES):
+            yield [part for route in routes.values() for part in route.split(batch_df)]
+
+    @staticmethod
+    def _normalized_hash(config: dict[str, any]) -> str:
+        """SHA-256 of a config, serialized as JSON with sorted keys, so the key
+        order in the config file does not matter."""
+        normalized = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _config_hash(self) -> str:
+        """
+        Hash of the configuration that determines the exported content: columns,
+        applied edits, formats/batching and writer options.
+        """
+        return self._normalized_hash({
+            "columns": self.to_select,
+            "edits": self.edit_history,
+            "output_formats_and_batching": self.output_formats_and_batching,
+            "export_options": {k: v for k, v in self.export_options.items() if k != "incremental"},
+            "csv_export_delimiter": self.csv_export_delimiter,
+        })
+
+    def _output_key(self, format_name: str, batching: str, input_checksums: dict[str, str]) -> str:
+        """
+        Key of an output file: the input files it is made of (name and checksum -
+        edits may derive values from the file name), plus the configuration of
+        its format and batching. An output whose key is unchanged would be
+        written byte for byte the same again.
+        """
+        key = {
+            "inputs": input_checksums,
+            "columns": self.to_select,
+            "edits": self.edit_history,
+            "format": format_name,
+            "batching": batching,
+            "options": self.export_options.get(format_name.lower(), {}),
+            "csv_export_delimiter": self.csv_export_delimiter if format_name.lower().startswith("csv") else None,
+        }
+        # Only part of the key when set, so unsorted outputs keep their keys
+        sort_by = self._sort_columns()
+        if sort_by:
+            key["sort_by"] = list(sort_by.items())
+        return self._normalized_hash(key)
+
+    def _load_manifest(self) -> dict[str, any] | None:
+        """The manifest of the previous export, None if there is none (or it is unreadable)."""
+        manifest_path = self.domain_exports / "manifest.json"
+        if not manifest_path.exists():
+            return None
+        try:
+            with open(manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+            return None
+
+    def _plan_incremental(self, previous_manifest: dict[str, any], format_name: str, batching: str, ingestion_tracker: dict[str, any]) -> tuple[list[dict[str, any]], set[str]]:
+        """
+        Find the outputs of a format/batching that can be kept from the previous
+        export: their key matches and the file is still there, with the same size.
+
+        With mirror_input, every input file has its own output and key, so a new
+        input file only adds one output. All other batching strategies mix the
+        input files, so their outputs are kept all together or not at all.
+
+        Returns:
+            The manifest entries of the kept outputs, and the input files whose
+            rows do not need to be written again
+        """
+        previous = [
+            output for output in previous_manifest.get("outputs", [])
+            if output.get("format") == format_name and output.get("batching") == batching
+        ]
+
+        def unchanged(output: dict[str, any], key: str) -> bool:
+            file_path = self.domain_exports / output["path"]
+            return (
+                output.get("key") == key
+                and file_path.exists()
+                and file_path.stat().st_size == output.get("bytes")
+            )
+
+        if batching == "mirror_input":
+            kept, skipped = [], set()
+            for file_name, metadata in ingestion_tracker.items():
+                key = self._output_key(format_name, batching, {file_name: metadata["checksum"]})
+                outputs = [output for output in previous if output.get("inputs") == [file_name]]
+                if outputs and all(unchanged(output, key) for output in outputs):
+                    kept += outputs
+                    skipped.add(file_name)
+            return kept, skipped
+
+        key = self._output_key(
+            format_name,
+            batching,
+            {file_name: metadata["checksum"] for file_name, metadata in ingestion_tracker.items()},
+        )
+        if previous and all(unchanged(output, key) for output in previous):
+            return previous, set(ingestion_tracker)
+        return [], set()
+
+    def _manifest_entry(self, format_name: str, batching: str, key: any, writer: BaseExportWriter, ingestion_tracker: dict[str, any]) -> dict[str, any]:
+        """Manifest record of a committed output file."""
+        if batching == "mirror_input":
+            file_names = [key[0]]
+        else:
+            file_names = sorted(ingestion_tracker)
+        return {
+            "path": writer.path.relative_to(self.domain_exports).as_posix(),
+            "format": format_name,
+            "batching": batching,
+            "rows": writer.rows_written,
+            "bytes": writer.bytes_written,
+            CHECKSUM_ALGORITHM: writer.checksum,
+            "inputs": file_names,
+            "key": self._output_key(
+                format_name,
+                batching,
+                {file_name: ingestion_tracker[file_name]["checksum"] for file_name in file_names},
+            ),
+        }
+
+    def _resumable_outputs(self, journal: ExportJournal, header: dict[str, any], resume: bool) -> dict[tuple[str, str], list[dict[str, any]]]:
+        """
+        Outputs completed by an interrupted export, per (format, batching).
+
+        They are only used if resume is set, the journal belongs to the same
+        export (same config hash and input files) and the files are still there
+        with the recorded size. Otherwise a new journal is started.
+        """
+        previous = journal.read()
+        if not resume:
+            if previous is not None:
+                self.logger.warning(
+                    "The previous export was interrupted. Starting over - run with --resume to continue it instead."
+                )
+            journal.start(header)
+            return {}
+
+        if previous is None:
+            self.logger.warning("No interrupted export to resume, exporting everything")
+            journal.start(header)
+            return {}
+        if previous[0] != header:
+            self.logger.warning("The configuration or the input files changed since the interrupted export, starting over")
+            journal.start(header)
+            return {}
+
+        completed = {}
+        for entry in previous[1]:
+            file_path = self.domain_exports / entry["path"]
+            if file_path.exists() and file_path.stat().st_size == entry["bytes"]:
+                completed.setdefault((entry["format"], entry["batching"]), []).append(entry)
+        self.logger.info(
+            f" -> RESUMING EXPORT, {sum(len(entries) for entries in completed.values())} files already complete"
+        )
+        return completed
+
+    def _write_manifest(self, routes: dict[tuple[str, str], BaseExportRoute], ingestion_tracker: dict[str, any], kept_outputs: list[dict[str, any]]) -> None:
+        """
+        Write domain_exports/manifest.json: the config hash, the ingested input
+        files (checksum, iceberg snapshot id) and every output file with its row
+        count, size, checksum - as hashed by the writers while writing - and the
+        key used by incremental exports. Outputs kept from the previous export
+        are carried over.
+        """
+        inputs = {}
+        for file_name, metadata in sorted(ingestion_tracker.items()):
+            inputs[file_name] = {
+                "checksum": metadata.get("checksum"),
+                # Not in trackers written before the id was recorded
+                "snapshot_id": metadata.get("snapshot_id"),
+            }
+
+        outputs = list(kept_outputs)
+        for (format_name, batching), route in routes.items():
+            for key, writer in route.writers.items():
+                if writer.checksum is None:
+                    continue  # nothing written
+                outputs.append(self._manifest_entry(format_name, str(batching), key, writer, ingestion_tracker))
+
+        manifest = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config_hash": self._config_hash(),
+            "inputs": inputs,
+            "outputs": sorted(outputs, key=lambda output: output["path"]),
+        }
+        export_to_json(manifest, self.domain_exports, "manifest")
+        self.logger.info(
+            f" -> MANIFEST WRITTEN TO {self.domain_exports / 'manifest.json'} "
+            f"({len(outputs) - len(kept_outputs)} files written, {len(kept_outputs)} kept)"
+        )
+
+    def _limit_writers(self, batchings: list[str]) -> None:
+        """
+        Bound the open output files of an export and the memory of their writers.
+
+        At most export_options["max_open_writers"] files (DEFAULT_MAX_OPEN_WRITERS)
+        are open at a time: monolith and row-count outputs hold one each, the
+        partitioned outputs (mirror_input, columns) share the rest. With
+        export_options["memory_budget_mb"], WRITER_BUDGET_SHARE of the budget is
+        split between the open writers (the Parquet buffers, the SQLite page
+        cache), at least MIN_WRITER_MEMORY_MB each - fewer files are kept open
+        if needed, but every output gets one.
+        """
+        n_single = sum(1 for batching in batchings if batching == "monolith" or batching.isnumeric())
+        n_partitioned = len(batchings) - n_single
+
+        max_open = int(self.export_options.get("max_open_writers", DEFAULT_MAX_OPEN_WRITERS))
+        if max_open < 1:
+            raise ExportError(f"export_options.max_open_writers must be positive, got {max_open}")
+        memory_budget_mb = self.export_options.get("memory_budget_mb")
+        if memory_budget_mb:
+            max_open = min(max_open, int(memory_budget_mb * WRITER_BUDGET_SHARE / MIN_WRITER_MEMORY_MB))
+        max_open = max(max_open, len(batchings))
+
+        self.partition_open_writers = (max_open - n_single) // n_partitioned if n_partitioned else None
+        self.writer_memory_mb = None
+        if memory_budget_mb and batchings:
+            n_open = n_single + n_partitioned * (self.partition_open_writers or 0)
+            self.writer_memory_mb = memory_budget_mb * WRITER_BUDGET_SHARE / n_open
+        if n_partitioned:
+            self.logger.info(
+                f" -> partitioned outputs keep at most {self.partition_open_writers} file(s) open"
+                + (f", {self.writer_memory_mb:.1f} MB per writer" if self.writer_memory_mb else "")
+            )
+
+    def _export_batch_rows(self, n_routes: int) -> int:
+        """
+        Rows per export batch. Without export_options["memory_budget_mb"] this is
+        EXPORT_BATCH_ROWS. With a budget, the batch is sized so that the batches
+        held at a time - the one being written, the split ones waiting and the
+        one being split, each with the parts every route splits off of it (about
+        one copy per route), plus the read ones waiting and the one being read -
+        fit in the budget (minus the writers' share, see _limit_writers),
+        estimating the row size from a sample of the edited table.
+        """
+        memory_budget_mb = self.export_options.get("memory_budget_mb")
+        if not memory_budget_mb:
+            return EXPORT_BATCH_ROWS
+
+        # The other share is for the open writers (see _limit_writers)
+        batch_budget_mb = memory_budget_mb * (1 - WRITER_BUDGET_SHARE)
+        row_bytes = self._row_bytes()
+        # Batches with their parts: written, waiting to be written, being split.
+        # Plain batches: waiting to be split, being read.
+        batch_copies = (1 + n_routes) * (EXPORT_PREFETCH_BATCHES + 2) + EXPORT_PREFETCH_BATCHES + 1
+        batch_rows = int(batch_budget_mb * 1024 ** 2 / (row_bytes * batch_copies))
+        if batch_rows < MIN_EXPORT_BATCH_ROWS:
+            self.logger.warning(
+                f"export_options.memory_budget_mb ({memory_budget_mb}) is too small for "
+                f"{n_routes} outputs, using batches of {MIN_EXPORT_BATCH_ROWS} rows"
+            )
+        return max(MIN_EXPORT_BATCH_ROWS, min(batch_rows, EXPORT_BATCH_ROWS))
+
+    def _partition_route(self, output_dir: Path, batching: str, writer_class: type[BaseExportWriter], **writer_options) -> PartitionRoute:
+        """
+        Partition the output by the values of one or more columns ("AG" or "AG,SE").
+
+        Formats with PARTITION_DIRECTORIES (Parquet, Feather) get a hive layout,
+        AG=3/SE=1/part-0.parquet, without the partition columns in the files
+        (arrow::open_dataset restores them from the paths). CSV gets one file per
+        value, AG=3_SE=1.csv, with all columns. Values are URI-encoded, nulls are
+        written as __HIVE_DEFAULT_PARTITION__. The route counts the partitions
+        as they appear in the single pass over the edited table, and aborts the
+        export as soon as there are more than export_options["max_partitions"].
+        """
+        by = [column.strip() for column in batching.split(",") if column.strip()]
+        available = self.to_select + ["file_name"]
+        unknown = [column for column in by if column not in available]
+        if unknown:
+            raise ExportError(f"Unknown batching strategy or partition columns: {unknown}")
+
+        max_partitions = int(self.export_options.get("max_partitions", DEFAULT_MAX_PARTITIONS))
+        if max_partitions < 1:
+            raise ExportError(f"export_options.max_partitions must be positive, got {max_partitions}")
+
+        def segment(column: str, value: any) -> str:
+            if value is None:
+                return f"{column}={HIVE_NULL_PARTITION}"
+            return f"{column}={quote(str(value), safe='')}"
+
+        extension = writer_class.EXTENSION
+        if writer_class.PARTITION_DIRECTORIES:
+            columns = [column for column in self.to_select if column not in by]
+            partition_path = lambda key: "/".join(
+                segment(column, value) for column, value in zip(by, key)
+            ) + f"/part-0.{extension}"
+        else:
+            columns = self.to_select
+            partition_path = lambda key: "_".join(
+                segment(column, value) for column, value in zip(by, key)
+            ) + f".{extension}"
+
+        self.logger.info(f" -> partitions by {by}, at most {max_partitions}")
+        return PartitionRoute(
+            output_dir, writer_class, columns, by, partition_path,
+            max_open=self.partition_open_writers, max_partitions=max_partitions,
+            spill_dir=self.filtered_dd_mirror, **writer_options,
+        )
+
+    def _build_route(self, output_dir: Path, batching: str, ingestion_tracker: dict[str, any], writer_class: type[BaseExportWriter], **writer_options) -> BaseExportRoute:
+        """Create the route for a batching strategy, for any writer."""
+        if self.writer_memory_mb:
+            writer_options.setdefault("memory_limit_mb", self.writer_memory_mb)
+        if batching == "monolith":
+            return MonolithRoute(output_dir, writer_class, self.to_select, **writer_options)
+        elif batching == "mirror_input":
+            # One output file per input file, named after the input without its extension
+            stems = {}
+            for file_name in sorted(ingestion_tracker):
+                stems.setdefault(Path(file_name).stem, []).append(file_name)
+            collisions = [file_names for file_names in stems.values() if len(file_names) > 1]
+            if collisions:
+                raise ExportError(
+                    f"mirror_input would write these input files to the same output file: {collisions}. "
+                    "Rename the input files so that they differ by more than the extension."
+                )
+            extension = writer_class.EXTENSION
+            return PartitionRoute(
+                output_dir,
+                writer_class,
+                self.to_select,
+                ["file_name"],
+                lambda key: f"{Path(key[0]).stem}.{extension}",
+                max_open=self.partition_open_writers,
+                spill_dir=self.filtered_dd_mirror,
+                # The batches follow the input files unless they are sorted or
+                # edited as a whole, so every file is committed once it is through
+                grouped=not self._sort_columns() and self._edits_rowwise(),
+                **writer_options,
+            )
+        elif batching.isnumeric():
+            return NumericRoute(output_dir, writer_class, self.to_select, int(batching), **writer_options)
+        else:
+            return self._partition_route(output_dir, batching, writer_class, **writer_options)
 
-    def _export_csv(self, output_dir, batching, ingestion_tracker):
+    def _csv_route(self, output_dir, batching, ingestion_tracker):
         """
-        Export data to CSV format with the specified batching strategy.
+        Route to CSV files with the specified batching strategy.
         
         Args:
             output_dir: Directory to write CSV files to
-            batching: batching strategy (monolith, mirror_input, or numeric value)
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
             ingestion_tracker: Dictionary mapping input files to metadata
         """
-        
-        
-        # For now, the monolith option extends mirror_input by concatenating all files
-        # This is not the most efficient way, but polars >1.26.0 forces ...
+        return self._build_route(
+            output_dir, batching, ingestion_tracker, CsvWriter, separator=self.csv_export_delimiter
+        )
 
-        count = 1
-        total = len(ingestion_tracker)
-        separator = self.csv_export_delimiter
+    def _csv_gz_route(self, output_dir, batching, ingestion_tracker):
+        """
+        Route to gzip compressed CSV files with the specified batching strategy.
 
-            
-        if batching == "monolith":
+        Writer options are read from export_options["csv.gz"] (see
+        CompressedCsvWriter): compression_level, threads, chunk_size_mb. All
+        files of the output share one compression pool of 'threads' threads.
 
-            file_path = output_dir / "domain_data_monolith.csv"
-            # ------------- Works with polars 1.30.0, but loads all data into memory
-            #self.logger.info(f"Exporting to {file_path}... (no streming)")
-            #df = lazy_df.collect()
-            
-            #df.write_csv(file_path, include_header=True, separator=',')
-            #self.logger.info(f"Exporting to {file_path} using streaming...")
-            # ------------------------------
-           # self.lazy_df.sink_csv(
-           #     file_path,
-           #     include_header=True,
-           #     #maintain_order=True,
-           #     #batch_size=25
-           #     engine='streaming'
-           # )
-            
-            # collect each file from file_name given the ingestion tracker
-            for file_name in ingestion_tracker:
-                df = self.parsed_table.filter(pl.col("file_name") == file_name).select(self.to_select).collect()
-                #write to csv
-                df.write_csv(output_dir / file_name, include_header=True, separator=separator)
-                self.logger.info(f"Exported {file_name}, {count}/{total}")
-                count += 1
-                
-            #self.logger.info("CSV export completed using streaming")
+        Args:
+            output_dir: Directory to write the files to
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
+            ingestion_tracker: Dictionary mapping input files to metadata
+        """
+        gzip_options = self.export_options.get("csv.gz", {})
+        return self._build_route(
+            output_dir, batching, ingestion_tracker, GzipCsvWriter,
+            separator=self.csv_export_delimiter, pool=self._compression_pool(gzip_options), **gzip_options
+        )
 
-            # Concatenate all files into one, use ingestion tracker again, but on the output ofc
+    def _csv_zst_route(self, output_dir, batching, ingestion_tracker):
+        """
+        Route to Zstandard compressed CSV files with the specified batching strategy.
 
-            combined_df = None
-            for file_name in ingestion_tracker:
-                df = pl.read_csv(output_dir / file_name, infer_schema_length=0)
-                if combined_df is None:
-                    combined_df = df
-                else:
-                    combined_df = pl.concat([combined_df, df], how="vertical_relaxed")
-            if combined_df is not None:
-                combined_df.write_csv(file_path, include_header=True, separator=separator)
-                self.logger.info("Concatenated all CSV files into domain_data.csv")
+        Writer options are read from export_options["csv.zst"] (see
+        CompressedCsvWriter): compression_level, threads, chunk_size_mb. All
+        files of the output share one compression pool of 'threads' threads.
 
+        Args:
+            output_dir: Directory to write the files to
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
+            ingestion_tracker: Dictionary mapping input files to metadata
+        """
+        zstd_options = self.export_options.get("csv.zst", {})
+        return self._build_route(
+            output_dir, batching, ingestion_tracker, ZstdCsvWriter,
+            separator=self.csv_export_delimiter, pool=self._compression_pool(zstd_options), **zstd_options
+        )
 
-            #self.logger.info("CSV export completed using streaming")
-                
-        # Currently, the only way to proc Out-of-RAM - usong polars 1.26.0
-        elif batching == "mirror_input":
-            
-            # collect each file from file_name given the ingestion tracker
-            for file_name in ingestion_tracker:
-                
-                self.logger.info(f"Exporting to {file_name} using mirror_input...")
-                df = self.parsed_table.filter(pl.col("file_name") == file_name).select(self.to_select).collect()
-                
-                #write to csv
-                df.write_csv(output_dir / file_name, include_header=True, separator=separator)
-                self.logger.info(f"Exported {file_name}, {count}/{total}")
-                count += 1
-                
-            self.logger.info("CSV export completed using mirror_input")
-        
+    def _compression_pool(self, options: dict[str, any]) -> ThreadPoolExecutor:
+        """A compression pool for the files of one output, shut down after the export."""
+        threads = int(options.get("threads") or os.cpu_count() or 1)
+        if threads < 1:
+            raise ExportError(f"Compression threads must be positive, got {threads}")
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="compress")
+        self.compression_pools.append(pool)
+        return pool
 
-        elif batching.isnumeric():
-            import gc
-                
-            # Define a function to process a single batch
-            def process_batch(lazy_frame, start_idx, batch_size, output_file):
-                """Process a single batch in a separate function scope"""
-                try:
-                    # Get this batch
-                    batch = lazy_frame.slice(start_idx, batch_size).collect()
-                    
-                    # Write to CSV
-                    batch.write_csv(output_file, include_header=True, separator=separator)
-                        
-                    # Return batch size for logging
-                    return len(batch)
-                finally:
-                    # Force cleanup
-                    gc.collect()
-                
-            # Use the batch size to partition the data
-            batch_size = int(batching)
-            
-            # Get row count (we need this for planning)
-            n_rows = self.lazy_df.select(pl.count()).collect().item()
-                
-                # Process each batch in a separate function call
-            for i in range(0, n_rows, batch_size):
-                batch_file = output_dir / f"domain_data_batch_{i // batch_size + 1}.csv"
-                
-                # Process this batch
-                rows_processed = process_batch(self.lazy_df, i, batch_size, batch_file)
-                
-                self.logger.info(f"Exported batch {i // batch_size + 1} ({i}–{i+rows_processed}) to {batch_file}")
-                
-                # Force garbage collection between batches
-                gc.collect()
-                
-                self.logger.info("CSV export completed using batch partitioning")
-            
+    def _parquet_route(self, output_dir, batching, ingestion_tracker):
+        """
+        Route to Parquet files with the specified batching strategy.
+
+        Writer options are read from export_options["parquet"] (see ParquetWriter):
+        compression, compression_level, row_group_size, dictionary, statistics.
+
+        Args:
+            output_dir: Directory to write Parquet files to
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
+            ingestion_tracker: Dictionary mapping input files to metadata
+        """
+        parquet_options = self.export_options.get("parquet", {})
+        return self._build_route(output_dir, batching, ingestion_tracker, ParquetWriter, **parquet_options)
+
+    def _feather_route(self, output_dir, batching, ingestion_tracker):
+        """
+        Route to Feather (Arrow IPC) files with the specified batching strategy.
+
+        Writer options are read from export_options["feather"] (see FeatherWriter):
+        compression ("uncompressed" for memory-mapping, "lz4", "zstd"),
+        compression_level, record_batch_size.
 
-    def _export_parquet(self, output_dir, batching, ingestion_tracker):
-        pass
+        Args:
+            output_dir: Directory to write Feather files to
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
+            ingestion_tracker: Dictionary mapping input files to metadata
+        """
+        feather_options = self.export_options.get("feather", {})
+        return self._build_route(output_dir, batching, ingestion_tracker, FeatherWriter, **feather_options)
+
+    def _xlsx_route(self, output_dir, batching, ingestion_tracker):
+        """
+        Route to Excel workbooks with the specified batching strategy.
+
+        Writer options are read from export_options["xlsx"] (see XlsxWriter):
+        sheet_name, max_sheet_rows. Sheets are split at Excel's row limit.
+
+        Args:
+            output_dir: Directory to write XLSX files to
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
+            ingestion_tracker: Dictionary mapping input files to metadata
+        """
+        xlsx_options = self.export_options.get("xlsx", {})
+        return self._build_route(output_dir, batching, ingestion_tracker, XlsxWriter, **xlsx_options)
+
+    def _sqlite_route(self, output_dir, batching, ingestion_tracker):
+        """
+        Route to SQLite databases with the specified batching strategy.
+
+        Writer options are read from export_options["sqlite"] (see SqliteWriter):
+        table_name, indexes, transaction_rows, cache_size_mb.
+
+        Args:
+            output_dir: Directory to write SQLite files to
+            batching: batching strategy (monolith, mirror_input, numeric value or partition columns)
+            ingestion_tracker: Dictionary mapping input files to metadata
+        """
+        sqlite_options = self.export_options.get("sqlite", {})
+        return self._build_route(output_dir, batching, ingestion_tracker, SqliteWriter, **sqlite_options)
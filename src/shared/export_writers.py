@@ -0,0 +1,933 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+PARQUET_CODECS = ["zstd", "snappy", "gzip", "lz4", "brotli", "none"]
+FEATHER_CODECS = ["uncompressed", "lz4", "zstd"]
+# Rows per worksheet in Excel 2007+, including the header row
+XLSX_MAX_SHEET_ROWS = 1_048_576
+CHECKSUM_ALGORITHM = "sha256"
+
+
+class HashingFile:
+    """
+    Binary output file that hashes the bytes on their way to disk, so the
+    checksum of an export is known when it is closed, without reading it again.
+
+    Writes are sequential only: tell() is the number of bytes written and the
+    file is not seekable (pyarrow and zipfile handle that).
+    """
+
+    def __init__(self, path: Path, algorithm: str = CHECKSUM_ALGORITHM):
+        self.file = open(path, "wb")
+        self.hash = hashlib.new(algorithm)
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.hash.update(data)
+        self.size += memoryview(data).nbytes
+        return self.file.write(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self) -> None:
+        self.file.flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    @property
+    def closed(self) -> bool:
+        return self.file.closed
+
+    def close(self) -> None:
+        self.file.close()
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+def file_checksum(path: Path, algorithm: str = CHECKSUM_ALGORITHM) -> str:
+    """Checksum of an existing file, read in chunks."""
+    hasher = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class BaseExportWriter(ABC):
+    """Abstract base class for export writers. A writer owns one output file,
+    takes the data batch by batch and finalizes the file on close().
+
+    The file is written under a temporary name (.<name>.partial) in the same
+    folder and renamed to its final name once it is complete, so an export that
+    dies halfway never leaves a partial file under a final name. abort() drops
+    the temporary file instead.
+    """
+
+    EXTENSION: str = ""  # Must be overridden by subclasses
+    # Column-value partitions as hive directories (col=value/) instead of one file per value
+    PARTITION_DIRECTORIES: bool = True
+
+    def __init__(self, path: Path, **options):
+        if not self.EXTENSION:
+            raise NotImplementedError(
+                f"{self.__class__.__name__} must define EXTENSION"
+            )
+        if not isinstance(path, Path):
+            raise TypeError("path must be a Path object")
+
+        self.path = path
+        self.temp_path = path.with_name(f".{path.name}.partial")
+        self.options = options
+        self.rows_written = 0
+        self.aborted = False
+
+        # Set when the file is committed, None if no file was written
+        self.sink = None
+        self.checksum = None
+        self.bytes_written = 0
+        # Called with the writer once its file is committed
+        self.on_commit: Callable[["BaseExportWriter"], None] | None = None
+
+    def write(self, df: pl.DataFrame) -> None:
+        """Append a batch to the output file."""
+        if df.height == 0:
+            return
+        self._write(df)
+        self.rows_written += df.height
+
+    @abstractmethod
+    def _write(self, df: pl.DataFrame) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        """Stop writing and delete the temporary file. Committed files are kept."""
+        self.aborted = True
+        try:
+            self.close()
+        except Exception:
+            pass
+        self.temp_path.unlink(missing_ok=True)
+
+    def _open_sink(self) -> HashingFile:
+        self.sink = HashingFile(self.temp_path)
+        return self.sink
+
+    def _close_sink(self) -> None:
+        """Close the output file and commit it."""
+        if self.sink is None:
+            self._commit(None, 0)  # never got a batch, see _commit
+            return
+        if self.sink.closed:
+            return
+        self.sink.close()
+        self._commit(self.sink.hexdigest(), self.sink.size)
+
+    def _commit(self, checksum: str | None, size: int) -> None:
+        """
+        Rename the finished file to its final name (or drop it, if aborted).
+
+        An output without rows is not written in any format: its file is dropped
+        (with the one of a previous export), so it gets no journal or manifest
+        entry, like a Parquet or Feather file that never got a batch.
+        """
+        if self.aborted:
+            self.temp_path.unlink(missing_ok=True)
+            return
+        if not self.rows_written:
+            self.temp_path.unlink(missing_ok=True)
+            self.path.unlink(missing_ok=True)
+            return
+        os.replace(self.temp_path, self.path)
+        self.checksum = checksum
+        self.bytes_written = size
+        if self.on_commit is not None:
+            self.on_commit(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvWriter(BaseExportWriter):
+    """CSV, the header is written with the first batch."""
+
+    EXTENSION = "csv"
+    PARTITION_DIRECTORIES = False
+
+    def __init__(self, path: Path, separator: str = ",", **options):
+        super().__init__(path, **options)
+        self.separator = separator
+        self.file = self._open_sink()
+
+    def _write(self, df: pl.DataFrame) -> None:
+        df.write_csv(self.file, include_header=self.rows_written == 0, separator=self.separator)
+
+    def close(self) -> None:
+        self._close_sink()
+
+
+class CompressedCsvWriter(CsvWriter):
+    """
+    Compressed CSV, written as a stream: every batch is formatted as CSV and
+    compressed in chunks of chunk_size_mb, each chunk an independent gzip member
+    or zstd frame. Concatenated members/frames are one valid stream for every
+    reader (gzip, zstd, R's readr and data.table::fread, polars), so the chunks
+    can be compressed in parallel by 'threads' threads (pyarrow's codecs release
+    the GIL). The output only depends on the data and the options, not on the
+    thread count.
+
+    Args:
+        compression_level: Codec specific level (gzip 1-9, zstd 1-22), None for DEFAULT_LEVEL
+        threads: Threads compressing the chunks of a batch, defaults to the CPU count
+        chunk_size_mb: Uncompressed size of the chunks
+        pool: Compression pool shared with other writers (eg. all files of a
+            partitioned export), of 'threads' threads. By default every writer
+            starts its own pool.
+    """
+
+    CODEC: str = ""  # Must be overridden by subclasses
+    DEFAULT_LEVEL: int | None = None  # None: the codec's own default
+
+    def __init__(
+        self,
+        path: Path,
+        separator: str = ",",
+        compression_level: int | None = None,
+        threads: int | None = None,
+        chunk_size_mb: float = 4,
+        pool: ThreadPoolExecutor | None = None,
+        **options,
+    ):
+        super().__init__(path, separator, **options)
+        if compression_level is None:
+            compression_level = self.DEFAULT_LEVEL
+        self.codec = pa.Codec(self.CODEC, compression_level)
+        self.compression_level = compression_level
+        # A codec must not be used by several threads at once, the pool threads get their own
+        self.thread_codecs = threading.local()
+        self.threads = int(threads or os.cpu_count() or 1)
+        self.chunk_size = int(chunk_size_mb * 1024 ** 2)
+        if self.threads < 1 or self.chunk_size < 1:
+            raise ValueError("threads and chunk_size_mb must be positive")
+        self.pool = pool
+        self.shared_pool = pool is not None
+
+    def _write(self, df: pl.DataFrame) -> None:
+        buffer = io.BytesIO()
+        df.write_csv(buffer, include_header=self.rows_written == 0, separator=self.separator)
+        data = buffer.getbuffer()
+        chunks = [data[start:start + self.chunk_size] for start in range(0, len(data), self.chunk_size)]
+
+        if len(chunks) > 1 and self.threads > 1:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="compress")
+            frames = self.pool.map(self._compress, chunks)
+        else:
+            frames = map(self.codec.compress, chunks)
+        for frame in frames:
+            self.file.write(frame)
+
+    def _compress(self, chunk) -> pa.Buffer:
+        """Compress a chunk on a pool thread, with the codec of that thread."""
+        codec = getattr(self.thread_codecs, "codec", None)
+        if codec is None:
+            codec = self.thread_codecs.codec = pa.Codec(self.CODEC, self.compression_level)
+        return codec.compress(chunk)
+
+    def close(self) -> None:
+        if self.pool is not None and not self.shared_pool:
+            self.pool.shutdown()
+        self.pool = None
+        super().close()
+
+
+class GzipCsvWriter(CompressedCsvWriter):
+    """gzip compressed CSV."""
+
+    EXTENSION = "csv.gz"
+    CODEC = "gzip"
+    # pyarrow defaults to 9, several times slower than 6 for a few percent smaller files
+    DEFAULT_LEVEL = 6
+
+
+class ZstdCsvWriter(CompressedCsvWriter):
+    """Zstandard compressed CSV."""
+
+    EXTENSION = "csv.zst"
+    CODEC = "zstd"
+
+
+class ParquetWriter(BaseExportWriter):
+    """
+    Parquet, written with pyarrow so that every option of the format is available.
+
+    Batches are buffered until row_group_size rows are reached, so all row groups
+    but the last one have exactly row_group_size rows - independent of the batch
+    size - and memory is bounded by one row group. With memory_limit_mb, the
+    buffer is also written (as a smaller row group) once it holds that much, eg.
+    when many partition files are open at a time.
+
+    Args:
+        compression: Codec, one of PARQUET_CODECS
+        compression_level: Codec specific level (eg. 1-22 for zstd), None for the default
+        row_group_size: Rows per row group
+        dictionary: Dictionary-encode all columns (True/False) or only the listed ones
+        statistics: Write min/max/null-count statistics per row group and column,
+            used by readers (eg. arrow::open_dataset in R) to skip row groups
+        memory_limit_mb: Maximum size of the buffered rows, None for one row group
+    """
+
+    EXTENSION = "parquet"
+
+    def __init__(
+        self,
+        path: Path,
+        compression: str = "zstd",
+        compression_level: int | None = None,
+        row_group_size: int = 100_000,
+        dictionary: bool | list[str] = True,
+        statistics: bool = True,
+        memory_limit_mb: float | None = None,
+        **options,
+    ):
+        super().__init__(path, **options)
+        if compression not in PARQUET_CODECS:
+            raise ValueError(f"Unknown parquet compression '{compression}', use one of {PARQUET_CODECS}")
+        if int(row_group_size) < 1:
+            raise ValueError(f"row_group_size must be positive, got {row_group_size}")
+
+        self.compression = compression
+        self.compression_level = compression_level
+        self.row_group_size = int(row_group_size)
+        self.dictionary = dictionary
+        self.statistics = statistics
+        self.memory_limit = int(memory_limit_mb * 1024 ** 2) if memory_limit_mb else None
+
+        self.writer = None
+        self.pending = []
+        self.pending_rows = 0
+
+    def _write(self, df: pl.DataFrame) -> None:
+        self.pending.append(df.to_arrow())
+        self.pending_rows += df.height
+        if self.pending_rows >= self.row_group_size:
+            self._flush(final=False)
+        if self.memory_limit and sum(table.nbytes for table in self.pending) >= self.memory_limit:
+            self._flush(final=True)
+
+    def _flush(self, final: bool) -> None:
+        """Write the buffered rows as full row groups (and the rest too, if final)."""
+        if not self.pending:
+            return
+
+        table = pa.concat_tables(self.pending)
+        n_rows = table.num_rows if final else table.num_rows - table.num_rows % self.row_group_size
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(
+                self._open_sink(),
+                table.schema,
+                compression=self.compression,
+                compression_level=self.compression_level,
+                use_dictionary=self.dictionary,
+                write_statistics=self.statistics,
+            )
+        self.writer.write_table(table.slice(0, n_rows), row_group_size=self.row_group_size)
+
+        rest = table.slice(n_rows)
+        self.pending = [rest] if rest.num_rows else []
+        self.pending_rows = rest.num_rows
+
+    def close(self) -> None:
+        self._flush(final=True)
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self._close_sink()
+
+
+
+class FeatherWriter(BaseExportWriter):
+    """
+    Feather v2 (Arrow IPC file format).
+
+    Uncompressed files keep the in-memory Arrow layout on disk, so R
+    (arrow::read_feather(mmap = TRUE)) and Python (pyarrow.memory_map) can map
+    them zero-copy. LZ4/ZSTD make the files smaller, but readers have to
+    decompress every record batch.
+
+    Args:
+        compression: One of FEATHER_CODECS
+        compression_level: ZSTD level, None for the default
+        record_batch_size: Maximum rows per record batch
+    """
+
+    EXTENSION = "feather"
+
+    def __init__(
+        self,
+        path: Path,
+        compression: str = "uncompressed",
+        compression_level: int | None = None,
+        record_batch_size: int = 100_000,
+        **options,
+    ):
+        super().__init__(path, **options)
+        if compression not in FEATHER_CODECS:
+            raise ValueError(f"Unknown feather compression '{compression}', use one of {FEATHER_CODECS}")
+
+        codec = None
+        if compression != "uncompressed":
+            codec = pa.Codec(compression, compression_level)
+        self.write_options = pa.ipc.IpcWriteOptions(compression=codec)
+        self.record_batch_size = int(record_batch_size)
+        self.writer = None
+
+    def _write(self, df: pl.DataFrame) -> None:
+        table = df.to_arrow()
+        if self.writer is None:
+            self.writer = pa.ipc.new_file(self._open_sink(), table.schema, options=self.write_options)
+        self.writer.write_table(table, max_chunksize=self.record_batch_size)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self._close_sink()
+
+
+class XlsxWriter(BaseExportWriter):
+    """
+    XLSX, written with xlsxwriter in constant_memory mode: every row is flushed
+    to disk as soon as the next one starts, so memory does not grow with the file.
+
+    A worksheet holds at most XLSX_MAX_SHEET_ROWS rows (header included), the
+    rows beyond that continue on the next sheet (data, data_2, ...). Use a numeric
+    batching to get one workbook per N rows instead.
+
+    Strings are written as text, never as formulas, numbers or hyperlinks.
+
+    Args:
+        sheet_name: Name of the first sheet, the following ones get a _<n> suffix
+        max_sheet_rows: Data rows per sheet, at most XLSX_MAX_SHEET_ROWS - 1
+    """
+
+    EXTENSION = "xlsx"
+    PARTITION_DIRECTORIES = False
+
+    def __init__(
+        self,
+        path: Path,
+        sheet_name: str = "data",
+        max_sheet_rows: int = XLSX_MAX_SHEET_ROWS - 1,
+        **options,
+    ):
+        super().__init__(path, **options)
+        if not 0 < int(max_sheet_rows) < XLSX_MAX_SHEET_ROWS:
+            raise ValueError(f"max_sheet_rows must be between 1 and {XLSX_MAX_SHEET_ROWS - 1}, got {max_sheet_rows}")
+
+        self.sheet_name = sheet_name
+        self.max_sheet_rows = int(max_sheet_rows)
+        self.workbook = xlsxwriter.Workbook(
+            self._open_sink(),
+            {"constant_memory": True, "strings_to_formulas": False, "strings_to_urls": False},
+        )
+        self.sheets = []
+        self.sheet_rows = 0  # data rows on the current sheet
+
+    def _add_sheet(self, columns: list[str]) -> None:
+        name = self.sheet_name if not self.sheets else f"{self.sheet_name}_{len(self.sheets) + 1}"
+        sheet = self.workbook.add_worksheet(name)
+        sheet.write_row(0, 0, columns)
+        self.sheets.append(sheet)
+        self.sheet_rows = 0
+
+    def _write(self, df: pl.DataFrame) -> None:
+        for row in df.iter_rows():
+            if not self.sheets or self.sheet_rows == self.max_sheet_rows:
+                self._add_sheet(df.columns)
+            self.sheet_rows += 1
+            self.sheets[-1].write_row(self.sheet_rows, 0, row)
+
+    def close(self) -> None:
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
+        self._close_sink()
+
+
+class SqliteWriter(BaseExportWriter):
+    """
+    SQLite, one table per file.
+
+    Tuned for a bulk load: no rollback journal, no fsync and an exclusive lock
+    while loading (a crash leaves a broken file, which the next export replaces).
+    Rows are inserted with executemany, batch by batch, and committed every
+    transaction_rows rows. Indexes are created after the load, which is much
+    faster than maintaining them during the inserts.
+
+    SQLite writes pages in any order, so unlike the other writers the checksum
+    is computed from the finished (temporary) file, right before the rename.
+
+    Args:
+        table_name: Name of the table
+        indexes: Columns to index after the load, an entry may also be a list of
+            columns for a composite index, eg. ["pyCura_id", ["AG", "SE"]]
+        transaction_rows: Rows per transaction
+        cache_size_mb: Page cache of the connection
+        memory_limit_mb: Caps the page cache, eg. when many files are open at a time
+    """
+
+    EXTENSION = "sqlite"
+    PARTITION_DIRECTORIES = False
+
+    def __init__(
+        self,
+        path: Path,
+        table_name: str = "domain_data",
+        indexes: list[str | list[str]] | None = None,
+        transaction_rows: int = 500_000,
+        cache_size_mb: int = 256,
+        memory_limit_mb: float | None = None,
+        **options,
+    ):
+        super().__init__(path, **options)
+        if int(transaction_rows) < 1:
+            raise ValueError(f"transaction_rows must be positive, got {transaction_rows}")
+
+        self.table_name = table_name
+        self.indexes = [[index] if isinstance(index, str) else list(index) for index in indexes or []]
+        self.transaction_rows = int(transaction_rows)
+        self.uncommitted_rows = 0
+
+        self.temp_path.unlink(missing_ok=True)
+        # Used by the export worker threads, one at a time
+        self.connection = sqlite3.connect(self.temp_path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA locking_mode = EXCLUSIVE")
+        self.connection.execute("PRAGMA temp_store = MEMORY")
+        if memory_limit_mb:
+            cache_size_mb = min(cache_size_mb, memory_limit_mb)
+        self.connection.execute(f"PRAGMA cache_size = {-max(1, int(cache_size_mb * 1024))}")
+        self.insert = None
+
+    @staticmethod
+    def _quote(identifier: str) -> str:
+        return '"' + identifier.replace('"', '""') + '"'
+
+    def _create_table(self, schema: pl.Schema) -> None:
+        missing = [column for index in self.indexes for column in index if column not in schema]
+        if missing:
+            raise ValueError(f"Cannot index {missing}, the columns are not exported")
+
+        def sql_type(dtype: pl.DataType) -> str:
+            if dtype.is_integer() or dtype == pl.Boolean:
+                return "INTEGER"
+            if dtype.is_float():
+                return "REAL"
+            return "TEXT"
+
+        columns = ", ".join(f"{self._quote(name)} {sql_type(dtype)}" for name, dtype in schema.items())
+        self.connection.execute(f"CREATE TABLE {self._quote(self.table_name)} ({columns})")
+        placeholders = ", ".join("?" for _ in schema)
+        self.insert = f"INSERT INTO {self._quote(self.table_name)} VALUES ({placeholders})"
+        self.connection.execute("BEGIN")
+
+    def _write(self, df: pl.DataFrame) -> None:
+        if self.insert is None:
+            self._create_table(df.schema)
+
+        # One transaction_rows slice at a time, tuples are built lazily per row
+        offset = 0
+        while offset < df.height:
+            take = min(self.transaction_rows - self.uncommitted_rows, df.height - offset)
+            self.connection.executemany(self.insert, df.slice(offset, take).iter_rows())
+            self.uncommitted_rows += take
+            offset += take
+            if self.uncommitted_rows == self.transaction_rows:
+                self.connection.execute("COMMIT")
+                self.connection.execute("BEGIN")
+                self.uncommitted_rows = 0
+
+    def close(self) -> None:
+        if self.connection is None:
+            return
+        if self.insert is not None and not self.aborted:
+            self.connection.execute("COMMIT")
+            for index in self.indexes:
+                index_name = self._quote(f"idx_{self.table_name}_{'_'.join(index)}")
+                index_columns = ", ".join(self._quote(column) for column in index)
+                self.connection.execute(
+                    f"CREATE INDEX {index_name} ON {self._quote(self.table_name)} ({index_columns})"
+                )
+            if self.indexes:
+                self.connection.execute("ANALYZE")
+        self.connection.close()
+        self.connection = None
+        if self.temp_path.exists():
+            if self.aborted or not self.rows_written:
+                self._commit(None, 0)
+            else:
+                self._commit(file_checksum(self.temp_path), self.temp_path.stat().st_size)
+
+
+# ---------------------------------------------------------------------------
+# Routes: one per configured format/batching. A route receives every batch of
+# the edited table and assigns its rows to the writer(s) of that output.
+
+# Column of the spilled rows of a PartitionRoute: the number of their partition
+SPILL_KEY = "__pycura_spill_key"
+
+
+def write_part(writer: BaseExportWriter, df: pl.DataFrame, close: bool) -> None:
+    """Write one assigned part, and close the writer if it is complete."""
+    writer.write(df)
+    if close:
+        writer.close()
+
+
+class SpillFile:
+    """
+    Rows set aside by a route (Arrow IPC stream in a buffer folder), read back
+    once the batches are through. Takes parts like a writer (see write_part).
+    """
+
+    def __init__(self, spill_dir: Path):
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        handle, path = tempfile.mkstemp(prefix="partition_spill_", suffix=".arrow", dir=spill_dir)
+        os.close(handle)
+        self.path = Path(path)
+        self.writer = None
+        self.rows_written = 0
+
+    def write(self, df: pl.DataFrame) -> None:
+        table = df.to_arrow()
+        if self.writer is None:
+            self.writer = pa.ipc.new_stream(str(self.path), table.schema)
+        self.writer.write_table(table)
+        self.rows_written += df.height
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def batches(self) -> Iterator[pl.DataFrame]:
+        """The spilled rows, record batch by record batch (memory-mapped)."""
+        self.close()
+        if not self.rows_written:
+            return
+        with pa.memory_map(str(self.path)) as source:
+            for record_batch in pa.ipc.open_stream(source):
+                yield pl.from_arrow(record_batch)
+
+    def remove(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+class BaseExportRoute(ABC):
+    """Abstract base class for routing the batches of the edited table to the
+    output file(s) of one format and batching strategy.
+
+    split() only decides which rows go to which writer; the parts it returns
+    touch distinct writers, so they can be written concurrently. File names are
+    assigned in split(), in row order, and do not depend on the write order.
+    """
+
+    def __init__(self, output_dir: Path, writer_class: type[BaseExportWriter], columns: list[str], **writer_options):
+        self.output_dir = output_dir
+        self.writer_class = writer_class
+        self.columns = columns
+        self.writer_options = writer_options
+        self.writers = {}  # key -> writer, in the order they were opened
+        # Called with (key, writer) whenever one of the files is committed
+        self.on_commit: Callable[[any, BaseExportWriter], None] | None = None
+
+    @abstractmethod
+    def split(self, df: pl.DataFrame) -> list[tuple[BaseExportWriter, pl.DataFrame, bool]]:
+        """Assign a batch to writers: [(writer, part, close after writing)]."""
+        pass
+
+    def write(self, df: pl.DataFrame) -> None:
+        for writer, part_df, close in self.split(df):
+            write_part(writer, part_df, close)
+
+    def spilled(self) -> SpillFile | None:
+        """After all batches were split: the rows the route set aside to write
+        afterwards (see split_spilled), None if there are none."""
+        return None
+
+    def close(self) -> None:
+        for writer in self.writers.values():
+            writer.close()
+
+    def abort(self) -> None:
+        for writer in self.writers.values():
+            writer.abort()
+        spill = self.spilled()
+        if spill is not None:
+            spill.remove()
+
+    @property
+    def rows_written(self) -> int:
+        return sum(writer.rows_written for writer in self.writers.values())
+
+    def _open(self, key: any, file_path: Path) -> BaseExportWriter:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        writer = self.writer_class(file_path, **self.writer_options)
+        writer.on_commit = lambda writer: self._committed(key, writer)
+        self.writers[key] = writer
+        return writer
+
+    def _committed(self, key: any, writer: BaseExportWriter) -> None:
+        if self.on_commit is not None:
+            self.on_commit(key, writer)
+
+
+class MonolithRoute(BaseExportRoute):
+    """All rows into one file."""
+
+    def __init__(self, output_dir: Path, writer_class: type[BaseExportWriter], columns: list[str], **writer_options):
+        super().__init__(output_dir, writer_class, columns, **writer_options)
+        self._open("monolith", output_dir / f"domain_data_monolith.{writer_class.EXTENSION}")
+
+    def split(self, df: pl.DataFrame) -> list[tuple[BaseExportWriter, pl.DataFrame, bool]]:
+        return [(self.writers["monolith"], df.select(self.columns), False)]
+
+
+class NumericRoute(BaseExportRoute):
+    """Roll over to a new file (domain_data_batch_<n>) every batch_size rows."""
+
+    def __init__(self, output_dir: Path, writer_class: type[BaseExportWriter], columns: list[str], batch_size: int, **writer_options):
+        super().__init__(output_dir, writer_class, columns, **writer_options)
+        if batch_size < 1:
+            raise ValueError(f"Batch size must be positive, got {batch_size}")
+        self.batch_size = batch_size
+        self.current = None
+        self.current_rows = 0  # rows assigned to the current file
+        self.skipped_batches = 0
+        self.skip_rows = 0
+
+    def skip_batches(self, n_batches: int) -> None:
+        """Continue after n_batches files that were written before (resume)."""
+        self.skipped_batches = n_batches
+        self.skip_rows = n_batches * self.batch_size
+
+    def split(self, df: pl.DataFrame) -> list[tuple[BaseExportWriter, pl.DataFrame, bool]]:
+        if self.skip_rows:
+            skip = min(self.skip_rows, df.height)
+            self.skip_rows -= skip
+            df = df.slice(skip)
+
+        parts = []
+        while df.height:
+            if self.current is None:
+                batch_number = self.skipped_batches + len(self.writers) + 1
+                self.current = self._open(
+                    batch_number,
+                    self.output_dir / f"domain_data_batch_{batch_number}.{self.writer_class.EXTENSION}",
+                )
+                self.current_rows = 0
+            take = min(self.batch_size - self.current_rows, df.height)
+            self.current_rows += take
+            full = self.current_rows == self.batch_size
+            parts.append((self.current, df.slice(0, take).select(self.columns), full))
+            df = df.slice(take)
+            if full:
+                self.current = None
+        return parts
+
+
+class TooManyPartitionsError(ValueError):
+    """A partitioned output got more distinct keys than its max_partitions."""
+
+
+class PartitionRoute(BaseExportRoute):
+    """
+    One file per distinct value of the 'by' columns: every batch is split by 'by'
+    and each part is appended to the (open) writer of its key.
+
+    Args:
+        by: Columns to partition by
+        partition_path: Maps a key (tuple of values) to a path relative to output_dir
+        max_open: Maximum number of writers open at a time, None for no limit.
+            The rows of the keys beyond it are spilled to spill_dir and written
+            once the batches are through (see split_spilled), so every file is
+            still written in one go, with its rows in batch order.
+        spill_dir: Folder for the spill file, required with max_open
+        max_partitions: Maximum number of distinct keys, None for no limit. The
+            keys are counted as they appear in the batches, and the first key
+            beyond it raises TooManyPartitionsError (the export is aborted).
+        grouped: The rows of every key arrive together (eg. mirror_input, the
+            input files are read one after the other), so a key's file is
+            closed - and committed - as soon as the batches move past it,
+            instead of at the end of the export. A key that shows up again
+            after that raises ValueError.
+
+    Keys in 'exclude' are not written (eg. outputs kept by an incremental export).
+    """
+
+    def __init__(self, output_dir: Path, writer_class: type[BaseExportWriter], columns: list[str], by: list[str], partition_path: Callable[[tuple], str], max_open: int | None = None, max_partitions: int | None = None, spill_dir: Path | None = None, grouped: bool = False, **writer_options):
+        super().__init__(output_dir, writer_class, columns, **writer_options)
+        if max_open is not None and max_open < 1:
+            raise ValueError(f"max_open must be positive, got {max_open}")
+        if max_open is not None and spill_dir is None:
+            raise ValueError("max_open requires a spill_dir")
+        self.by = by
+        self.partition_path = partition_path
+        self.max_open = max_open
+        self.max_partitions = max_partitions
+        self.spill_dir = spill_dir
+        self.grouped = grouped
+        self.keys = set()  # every key seen so far
+        self.exclude = set()
+        self.open_keys = set()  # keys with an open writer
+        self.spill = None
+        self.spill_keys = {}  # key -> number of the spilled key, in order of appearance
+        self.spill_current = None  # key of the spilled rows being written
+
+    def split(self, df: pl.DataFrame) -> list[tuple[BaseExportWriter, pl.DataFrame, bool]]:
+        parts, spilled = [], []
+        partitions = df.partition_by(self.by, as_dict=True, maintain_order=True)
+        last_key = list(partitions)[-1] if partitions else None
+        if self.grouped:
+            # Files the batches moved past (one part per writer and batch)
+            for key in [key for key in self.open_keys if key not in partitions]:
+                parts.append((self.writers[key], df.select(self.columns).clear(), True))
+                self.open_keys.discard(key)
+
+        for key, part_df in partitions.items():
+            if key not in self.keys:
+                self.keys.add(key)
+                if self.max_partitions is not None and len(self.keys) > self.max_partitions:
+                    raise TooManyPartitionsError(
+                        f"Partitioning by {self.by} writes more than {self.max_partitions} partitions"
+                    )
+            elif self.grouped and key not in self.open_keys and key in self.writers:
+                raise ValueError(f"The rows of {key} are not together, its file was already committed")
+            if key in self.exclude:
+                continue
+            writer = self.writers.get(key)
+            if writer is None and key not in self.spill_keys and (
+                self.max_open is None or len(self.open_keys) < self.max_open
+            ):
+                writer = self._open(key, self.output_dir / self.partition_path(key))
+                self.open_keys.add(key)
+            if writer is None:
+                spill_key = self.spill_keys.setdefault(key, len(self.spill_keys))
+                spilled.append(part_df.select(self.columns).with_columns(pl.lit(spill_key, pl.Int64).alias(SPILL_KEY)))
+            else:
+                # Grouped: only the last key of the batch can continue in the next one
+                done = self.grouped and key != last_key
+                parts.append((writer, part_df.select(self.columns), done))
+                if done:
+                    self.open_keys.discard(key)
+
+        if spilled:
+            if self.spill is None:
+                self.spill = SpillFile(self.spill_dir)
+            parts.append((self.spill, pl.concat(spilled), False))
+        return parts
+
+    def spilled(self) -> SpillFile | None:
+        return self.spill
+
+    def split_spilled(self, df: pl.DataFrame) -> list[tuple[BaseExportWriter, pl.DataFrame, bool]]:
+        """
+        Assign a batch of the spilled rows, sorted by SPILL_KEY (stable, so in
+        batch order within a key): every key is written in one go and its
+        writer is closed when the next key starts, so one file is open at a time.
+        """
+        keys = list(self.spill_keys)
+        parts = []
+        for (spill_key,), part_df in df.partition_by(SPILL_KEY, as_dict=True, maintain_order=True).items():
+            key = keys[spill_key]
+            if key != self.spill_current:
+                if parts:
+                    # Close with the last part of this batch (one part per writer and batch)
+                    writer, last_df, _ = parts.pop()
+                    parts.append((writer, last_df, True))
+                elif self.spill_current is not None:
+                    parts.append((self.writers[self.spill_current], part_df.drop(SPILL_KEY).clear(), True))
+                self.spill_current = key
+                self._open(key, self.output_dir / self.partition_path(key))
+            parts.append((self.writers[key], part_df.drop(SPILL_KEY), False))
+        return parts
+
+
+class ExportJournal:
+    """
+    Progress journal of an export: a JSON-lines file whose first line
+    identifies the export (header) and every following line records one
+    committed output file. Lines are flushed and synced as they are written, so
+    after a crash the journal lists exactly the files that are complete.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def start(self, header: dict[str, any]) -> None:
+        """Start a new journal, dropping the previous one."""
+        with self.lock, open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, sort_keys=True) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, entry: dict[str, any]) -> None:
+        """Append one committed output (called from the export worker threads)."""
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self) -> tuple[dict[str, any], list[dict[str, any]]] | None:
+        """Header and entries of the journal, None if there is none. A torn last
+        line (crash while appending) is ignored."""
+        if not self.path.exists():
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        if not lines:
+            return None
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        if not records:
+            return None
+        return records[0], records[1:]
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
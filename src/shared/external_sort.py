@@ -0,0 +1,151 @@
+import shutil
+import tempfile
+from collections.abc import Iterable
+from pathlib import Path
+
+import polars as pl
+import pyarrow as pa
+
+# Added while sorting, so that the sort is stable and every row has a unique key
+ROW_INDEX = "__pycura_row"
+# Runs are written in record batches of 1/RUN_BATCHES of a run, the merge reads
+# them in chunks of about run_rows / number of runs
+RUN_BATCHES = 64
+
+
+def external_sort(source: Iterable[pl.DataFrame], target: Path, by: list[str], run_rows: int, spill_dir: Path) -> int:
+    """
+    Sort a stream of DataFrames (all with the same schema) by the 'by' columns
+    into an Arrow IPC file, without holding more than run_rows rows in memory.
+
+    The source is cut into runs of run_rows rows, each run is sorted in memory
+    and spilled to spill_dir. The sorted runs are then merged (k-way) chunk by
+    chunk: from every run, all rows up to the smallest "last key" of the current
+    chunks are taken, sorted and written - those rows cannot be preceded by any
+    row that was not read yet. Ascending, nulls first, ties keep their order
+    in the source (like DataFrame.sort(by, maintain_order=True)).
+
+    Args:
+        source: DataFrames to sort, eg. batches of a larger-than-memory table
+        target: Sorted IPC file to write
+        by: Columns to sort by
+        run_rows: Rows per run (the memory bound)
+        spill_dir: Folder for the runs, a temporary subfolder is created and removed
+
+    Returns:
+        The number of runs (1 means the data was sorted in memory, 0 that the
+        source was empty and no target was written)
+    """
+    if run_rows < 1:
+        raise ValueError(f"run_rows must be positive, got {run_rows}")
+
+    keys = by + [ROW_INDEX]
+    run_folder = Path(tempfile.mkdtemp(prefix="sort_runs_", dir=spill_dir))
+    try:
+        run_paths = []
+        pending, pending_rows, offset = [], 0, 0
+        schema = None
+
+        def spill() -> None:
+            nonlocal pending, pending_rows, offset
+            run_df = pl.concat(pending).with_row_index(ROW_INDEX, offset).sort(keys)
+            run_paths.append(run_folder / f"run_{len(run_paths)}.arrow")
+            _write_ipc(run_df, run_paths[-1], max(1, run_rows // RUN_BATCHES))
+            offset += pending_rows
+            pending, pending_rows = [], 0
+
+        for df in source:
+            if schema is None:
+                schema = df.to_arrow().schema
+            while df.height:
+                take = min(run_rows - pending_rows, df.height)
+                pending.append(df.slice(0, take))
+                pending_rows += take
+                df = df.slice(take)
+                if pending_rows == run_rows:
+                    spill()
+        if pending_rows:
+            spill()
+
+        if not run_paths:
+            return 0  # empty source, no target
+
+        if len(run_paths) == 1:
+            with pa.memory_map(str(run_paths[0])) as run_file:
+                sorted_df = pl.from_arrow(pa.ipc.open_file(run_file).read_all())
+                _write_ipc(sorted_df.drop(ROW_INDEX), target, run_rows)
+        else:
+            _merge_runs(run_paths, target, keys, schema, max(1, run_rows // len(run_paths)))
+        return len(run_paths)
+    finally:
+        shutil.rmtree(run_folder, ignore_errors=True)
+
+
+def _write_ipc(df: pl.DataFrame, path: Path, chunk_rows: int) -> None:
+    table = df.to_arrow()
+    with pa.ipc.new_file(path, table.schema) as writer:
+        writer.write_table(table, max_chunksize=chunk_rows)
+
+
+def _merge_runs(run_paths: list[Path], target: Path, keys: list[str], schema: pa.Schema, chunk_rows: int) -> None:
+    """k-way merge of sorted runs (each sorted by keys, all keys unique), reading
+    about chunk_rows rows of every run at a time."""
+    run_files = [pa.memory_map(str(path)) for path in run_paths]
+    readers = [pa.ipc.open_file(run_file) for run_file in run_files]
+    positions = [0] * len(readers)
+
+    def next_chunk(i: int, n_rows: int = 0) -> pl.DataFrame | None:
+        record_batches = []
+        while n_rows < chunk_rows and positions[i] < readers[i].num_record_batches:
+            record_batches.append(readers[i].get_batch(positions[i]))
+            n_rows += record_batches[-1].num_rows
+            positions[i] += 1
+        if not record_batches:
+            return None
+        return pl.from_arrow(pa.Table.from_batches(record_batches))
+
+    try:
+        current = [next_chunk(i) for i in range(len(readers))]
+        with pa.ipc.new_file(target, schema) as writer:
+            while True:
+                active = [i for i, chunk in enumerate(current) if chunk is not None]
+                if not active:
+                    break
+
+                boundary = min(
+                    (current[i].select(keys).row(-1) for i in active),
+                    key=lambda row: tuple((value is not None, value) for value in row),
+                )
+                up_to_boundary = _less_or_equal(keys, boundary)
+
+                parts = []
+                for i in active:
+                    # The chunk is sorted, so the rows up to the boundary are a prefix
+                    n_rows = current[i].select(up_to_boundary.sum()).item()
+                    parts.append(current[i].head(n_rows))
+                    rest = current[i].slice(n_rows)
+                    # Top the chunk up, a small rest would hold back the next boundary
+                    more = next_chunk(i, rest.height)
+                    if more is not None:
+                        rest = pl.concat([rest, more])
+                    current[i] = rest if rest.height else None
+
+                merged = pl.concat(parts).sort(keys).drop(ROW_INDEX)
+                writer.write_table(merged.to_arrow().cast(schema))
+    finally:
+        for run_file in run_files:
+            run_file.close()
+
+
+def _less_or_equal(keys: list[str], boundary: tuple) -> pl.Expr:
+    """Rows whose key is <= boundary, in lexicographic order with nulls first."""
+    expression = None
+    for column, value in reversed(list(zip(keys, boundary))):
+        col = pl.col(column)
+        if value is None:
+            less, equal = pl.lit(False), col.is_null()
+        else:
+            less = col.is_null() | (col < value).fill_null(False)
+            equal = (col == value).fill_null(False)
+        expression = (less | equal) if expression is None else (less | (equal & expression))
+    return expression
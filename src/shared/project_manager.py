@@ -141,7 +141,8 @@ class ProjectManager:
             "cb_inspections": self.config["cb_inspections"],
             "key_export_ban": self.config["key_export_ban"],
             "select_parser": self.config["select_parser"],
-            "append_new_metadata": self.config["append_new_metadata"]
+            "append_new_metadata": self.config["append_new_metadata"],
+            "codebook_export": self.config.get("codebook_export", {}),
         }
 
         self.dd_injection = {
@@ -150,6 +151,7 @@ class ProjectManager:
             "module_paths": self.module_paths,
             "whitelist": self.config["white_list"],
             "output_formats_and_batching": self.config["output_formats_and_batching"],
+            "export_options": self.config.get("export_options", {}),
             "parsing_options": self.config["parsing_options"],
             
             "input_paths": self.input_paths,
@@ -157,7 +159,9 @@ class ProjectManager:
             "output_paths": self.output_paths_dd,
 
             "dd_inspections": self.config["dd_inspections"],
+            "codebook_mirror": self.buffer_paths_cb["f_filtered_cb_mirror"],
             "csv_export_delimiter": self.config["csv_export_delimiter"],
+            "inspection_store": self.config.get("inspection_store", {}),
             
         }
 
@@ -1,6 +1,11 @@
 import json
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+import queue
 import re
+import threading
+
+import polars as pl
 
 
 def filter_by_whitelist(data: list | dict[str, any], white_list: list[str]) -> list | dict[str, any]:
@@ -133,6 +138,127 @@ def merge_dicts(dict_0: dict[str, any], dict_1: dict[str, any], subkey_tag: str)
     return merged
 
 
+def counts_to_dict(counts_df: pl.DataFrame, key_col: str, count_col: str, by_file: bool = False) -> dict[str, any]:
+    """Turn a grouped (key, count) DataFrame into an inspection map.
+
+    If by_file is set, counts_df is expected to be grouped by 'file_name' as well
+    (one grouped query). The global map is then derived from the per-file counts
+    and returned next to a nested per-file section:
+
+        {"all_files": {key: count}, "by_file": {file_name: {key: count}}}
+    """
+    if not by_file:
+        counts_df = counts_df.sort(key_col)
+        return dict(zip(counts_df[key_col].to_list(), counts_df[count_col].to_list()))
+
+    all_files_df = (
+        counts_df
+        .group_by(key_col)
+        .agg(pl.col(count_col).sum())
+        .sort(key_col)
+    )
+    by_file_map = {}
+    for (file_name,), file_df in sorted(counts_df.partition_by("file_name", as_dict=True).items()):
+        file_df = file_df.sort(key_col)
+        by_file_map[file_name] = dict(zip(file_df[key_col].to_list(), file_df[count_col].to_list()))
+
+    return {
+        "all_files": dict(zip(all_files_df[key_col].to_list(), all_files_df[count_col].to_list())),
+        "by_file": by_file_map,
+    }
+
+
+def inspection_to_long(data: dict[str, any], inspection: str, phase: str) -> pl.DataFrame:
+    """Flatten an inspection result {column: {...}} into long format.
+
+    Every numeric leaf becomes one row (column, inspection, phase, section, value, count),
+    where value is the leaf key and section holds the path of nested keys in between
+    (eg. 'by_file/a.csv' or 'AG x ED/cells', '' for flat maps). List leaves (eg.
+    unused_codes) become one row per item with a null count.
+    """
+    rows = {"column": [], "section": [], "value": [], "count": []}
+
+    def add(column: str, path: list[str], value: any, count: any) -> None:
+        rows["column"].append(column)
+        rows["section"].append("/".join(path))
+        rows["value"].append(None if value is None else str(value))
+        rows["count"].append(count)
+
+    def walk(column: str, node: dict[str, any], path: list[str]) -> None:
+        for key, leaf in node.items():
+            if isinstance(leaf, dict):
+                walk(column, leaf, path + [str(key)])
+            elif isinstance(leaf, list):
+                for item in leaf:
+                    add(column, path + [str(key)], item, None)
+            elif isinstance(leaf, bool):
+                add(column, path, key, int(leaf))
+            elif isinstance(leaf, (int, float)) or leaf is None:
+                add(column, path, key, leaf)
+            else:
+                add(column, path + [str(key)], leaf, None)
+
+    for column, result in data.items():
+        if isinstance(result, dict):
+            walk(column, result, [])
+
+    return pl.DataFrame(
+        rows, schema_overrides={"column": pl.Utf8, "section": pl.Utf8, "value": pl.Utf8}, strict=False
+    ).select(
+        "column",
+        pl.lit(inspection).alias("inspection"),
+        pl.lit(phase).alias("phase"),
+        "section",
+        "value",
+        "count",
+    )
+
+
+def export_to_store(data: pl.DataFrame, folder: Path, filename: str, store_format: str = "parquet") -> Path:
+    """Write a long-format inspection table as Parquet or Arrow IPC (Feather v2)."""
+
+    if store_format not in ("parquet", "arrow"):
+        raise ValueError(f"store format must be 'parquet' or 'arrow', got '{store_format}'")
+    if not isinstance(folder, Path):
+        raise TypeError("folder must be a Path object")
+
+    output_path = folder / f"{filename}.{store_format}"
+    if store_format == "parquet":
+        data.write_parquet(output_path, compression="zstd", statistics=True)
+    else:
+        data.write_ipc(output_path, compression="zstd")
+    return output_path
+
+
+def summarize_inspection(data: dict[str, any], max_entries: int) -> dict[str, any]:
+    """Shrink an inspection result for the JSON summary view.
+
+    Maps with more than max_entries numeric entries keep only the max_entries largest
+    ones; the rest is collapsed into '<other>': {"entries": n, "count": sum}. An
+    '<other>' bucket the inspection wrote itself (eg. occurrence_map's top_k) is
+    added to, not replaced. Inspections that bound their own output
+    (BOUNDED_OUTPUT) are not summarized at all.
+    """
+    summary = {}
+    for key, node in data.items():
+        if isinstance(node, dict):
+            node = summarize_inspection(node, max_entries)
+            counts = {
+                k: v for k, v in node.items()
+                if isinstance(v, (int, float)) and not isinstance(v, bool)
+            }
+            if len(counts) > max_entries:
+                dropped = set(sorted(counts, key=lambda k: counts[k], reverse=True)[max_entries:])
+                node = {k: v for k, v in node.items() if k not in dropped}
+                other = node.get("<other>", {"entries": 0, "count": 0})
+                node["<other>"] = {
+                    "entries": other["entries"] + len(dropped),
+                    "count": other["count"] + sum(counts[k] for k in dropped),
+                }
+        summary[key] = node
+    return summary
+
+
 
 #  --------- LEGACY FUNCTIONS ---------
 
@@ -287,4 +413,57 @@ def plot_length_distribution(length_map: dict[str, any], title: str, path: Path)
                 bbox_inches='tight',
                 dpi=300,
                 format='png')
-    plt.close()
\ No newline at end of file
+    plt.close()
+
+
+def prefetch(items: Iterable[any], depth: int = 1) -> Iterator[any]:
+    """
+    Iterate over items on a background thread, so the next items are computed
+    while the caller works on the current one (double buffering).
+
+    The hand-over queue holds at most depth items, which bounds the memory: the
+    item being consumed, depth items in the queue and one in the making.
+    Exceptions of the producer are raised in the consumer. If the consumer
+    stops early (break, error), the producer stops after its current item.
+    """
+    if depth < 1:
+        raise ValueError(f"Prefetch depth must be positive, got {depth}")
+
+    handover = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry: tuple[str, any]) -> bool:
+        while not stop.is_set():
+            try:
+                handover.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = handover.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+        producer.join()